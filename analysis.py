@@ -0,0 +1,266 @@
+# Hunter McKnight
+# KRCourse 2017
+
+import argparse
+import math
+import multiprocessing
+import os
+import numpy as np
+
+# the solver metrics compared between x-sudoku and sudoku stripe
+METRICS = ('max_level', 'num_decisions', 'conflicts')
+
+# the satisfiability classes puzzles are summarized by
+CLASSES = ('x only', 'stripe only', 'both', 'neither')
+
+# paired differences of the current worker process, filled in by init_bootstrap
+_worker = {}
+
+def load_metrics(path='metrics.csv'):
+    """
+    (str) -> {str: np.array}
+
+    Load a metrics.csv into one numpy array per column, by column
+    name. Satisfiability and timeout columns are boolean, metrics
+    are integers and solver names are strings.
+    """
+
+    table = np.genfromtxt(path, delimiter=',', names=True, dtype=None, encoding='utf-8')
+    table = np.atleast_1d(table)
+    columns = {}
+    for name in table.dtype.names:
+        column = table[name]
+        if column.dtype.kind == 'U' and set(np.unique(column)) <= set(['True', 'False']):
+            # a column of one value may be read as text
+            column = column == 'True'
+        columns[name] = column
+    return columns
+
+def completed(columns):
+    """
+    ({str: np.array}) -> np.array
+
+    Return which puzzles finished under both rule sets, i.e. did not
+    time out (all of them if the run had no timeout columns).
+    """
+
+    n_puzzles = len(columns['x_satisfiable'])
+    done = np.ones(n_puzzles, bool)
+    for name in ('x_timeout', 'stripe_timeout'):
+        if name in columns:
+            done &= ~columns[name].astype(bool)
+    return done
+
+def satisfiability_class(columns):
+    """
+    ({str: np.array}) -> np.array
+
+    Return each puzzle's index into CLASSES: solvable as x-sudoku
+    only, as sudoku stripe only, both ways, or neither.
+    """
+
+    x = columns['x_satisfiable'].astype(bool)
+    stripe = columns['stripe_satisfiable'].astype(bool)
+    return np.where(x & ~stripe, 0, np.where(~x & stripe, 1, np.where(x & stripe, 2, 3)))
+
+def paired_differences(columns):
+    """
+    ({str: np.array}) -> np.array
+
+    Return the stripe minus x-sudoku difference of each metric for
+    each puzzle, as a (len(METRICS), n_puzzles) float array.
+    """
+
+    return np.array([columns['stripe_' + metric].astype(np.float64) - columns['x_' + metric]
+                     for metric in METRICS])
+
+def normal_p_value(z):
+    """
+    (np.array) -> np.array
+
+    Return the two-sided p-value of standard normal statistics.
+    """
+
+    return np.vectorize(math.erfc)(np.abs(z) / math.sqrt(2))
+
+def paired_t_test(differences):
+    """
+    (np.array) -> (np.array, np.array)
+
+    Test, for each row of differences, whether the mean difference is
+    zero. Return the t statistics and their two-sided p-values, from
+    the normal approximation to the t distribution, which is close
+    for the thousands of pairs of a run. Rows without any spread get
+    a t of 0 and a p-value of 1.
+    """
+
+    n = differences.shape[1]
+    spread = differences.std(axis=1, ddof=1) if n > 1 else np.zeros(len(differences))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.where(spread > 0, differences.mean(axis=1) / (spread / math.sqrt(n)), 0.0)
+    return t, normal_p_value(t)
+
+def average_ranks(values):
+    """
+    (np.array) -> np.array
+
+    Rank the values of a 1-D array from 1, giving tied values the
+    mean of their ranks.
+    """
+
+    unique, inverse, counts = np.unique(values, return_inverse=True, return_counts=True)
+    # the last rank of each run of ties, minus half the run's length
+    ends = np.cumsum(counts)
+    return (ends - (counts - 1) / 2.0)[inverse]
+
+def wilcoxon_test(differences):
+    """
+    (np.array) -> (np.array, np.array)
+
+    Wilcoxon signed-rank test of each row of differences: zero
+    differences are dropped, the rest ranked by size with ties
+    averaged, and the sum of the positive ranks compared to its
+    normal approximation with a tie correction. Return the z
+    statistics and their two-sided p-values.
+    """
+
+    z = np.zeros(len(differences))
+    for row, difference in enumerate(differences):
+        difference = difference[difference != 0]
+        n = len(difference)
+        if n == 0:
+            continue
+        ranks = average_ranks(np.abs(difference))
+        positive = ranks[difference > 0].sum()
+        mean = n * (n + 1) / 4.0
+        _, ties = np.unique(np.abs(difference), return_counts=True)
+        variance = n * (n + 1) * (2 * n + 1) / 24.0 - (ties ** 3 - ties).sum() / 48.0
+        if variance > 0:
+            z[row] = (positive - mean) / math.sqrt(variance)
+    return z, normal_p_value(z)
+
+def init_bootstrap(differences):
+    """
+    (np.array) -> None
+
+    Prepare the current process to resample the paired differences.
+    """
+
+    _worker['differences'] = differences
+
+def bootstrap_chunk(task):
+    """
+    ((int, np.random.SeedSequence)) -> np.array
+
+    Draw resamples of the current worker's paired differences, as
+    many as the task asks, from the task's seed, and return the mean
+    of each metric's differences in each, as a (len(METRICS),
+    resamples) array. Resamples are drawn all at once as a matrix of
+    indices.
+    """
+
+    resamples, seed = task
+    differences = _worker['differences']
+    n = differences.shape[1]
+    rng = np.random.default_rng(seed)
+    indices = rng.integers(0, n, size=(resamples, n), dtype=np.int32)
+    return np.array([np.take(difference, indices).sum(axis=1) for difference in differences]) / n
+
+def bootstrap(differences, resamples=10000, confidence=0.95, workers=1, seed=0, chunk=100):
+    """
+    (np.array, int, float, int, int, int) -> (np.array, np.array)
+
+    Return percentile bootstrap confidence intervals for the mean of
+    each row of paired differences: the lower and upper bounds, one
+    per row. Resamples are drawn chunk at a time, each chunk from its
+    own seed spawned from seed, so the intervals do not depend on the
+    number of workers the chunks are spread over.
+    """
+
+    sizes = [min(chunk, resamples - start) for start in range(0, resamples, chunk)]
+    tasks = list(zip(sizes, np.random.SeedSequence(seed).spawn(len(sizes))))
+    if workers > 1:
+        pool = multiprocessing.Pool(workers, init_bootstrap, (differences,))
+        means = pool.map(bootstrap_chunk, tasks)
+        pool.close()
+        pool.join()
+    else:
+        init_bootstrap(differences)
+        means = list(map(bootstrap_chunk, tasks))
+    means = np.concatenate(means, axis=1)
+    alpha = (1 - confidence) / 2
+    return np.quantile(means, alpha, axis=1), np.quantile(means, 1 - alpha, axis=1)
+
+def summarize_classes(columns):
+    """
+    ({str: np.array}) -> [(str, int, np.array, np.array)]
+
+    For each satisfiability class, return its name, its number of
+    puzzles, and the mean of each metric for x-sudoku and for sudoku
+    stripe (NaN for empty classes).
+    """
+
+    classes = satisfiability_class(columns)
+    counts = np.bincount(classes, minlength=len(CLASSES))
+    summary = []
+    for rules in ('x', 'stripe'):
+        sums = np.array([np.bincount(classes, weights=columns[rules + '_' + metric].astype(np.float64),
+                                     minlength=len(CLASSES)) for metric in METRICS])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            summary.append(sums / counts)
+    return [(name, int(counts[k]), summary[0][:, k], summary[1][:, k]) for k, name in enumerate(CLASSES)]
+
+def analyze(path='metrics.csv', resamples=10000, confidence=0.95, workers=1, seed=0):
+    """
+    (str, int, float, int, int) -> str
+
+    Compare x-sudoku and sudoku stripe difficulty in a metrics.csv:
+    the mean paired difference (stripe minus x) of each metric with
+    its bootstrap confidence interval, a paired t-test and a Wilcoxon
+    signed-rank test, over the puzzles that did not time out, and the
+    mean metrics of each satisfiability class. Return the report.
+    """
+
+    columns = load_metrics(path)
+    done = completed(columns)
+    if not done.all():
+        columns = dict((name, column[done]) for name, column in columns.items())
+    n_puzzles = len(columns['x_satisfiable'])
+    if n_puzzles == 0:
+        raise ValueError(path + ' has no finished puzzles')
+
+    differences = paired_differences(columns)
+    low, high = bootstrap(differences, resamples, confidence, workers, seed)
+    t, t_p = paired_t_test(differences)
+    z, z_p = wilcoxon_test(differences)
+
+    lines = [str(n_puzzles) + ' puzzles' + ('' if done.all() else ' (' + str(int((~done).sum()))
+                                            + ' timed out and left out)')
+             + ', stripe minus x-sudoku, ' + str(resamples) + ' bootstrap resamples:',
+             '{:<15}{:>12}{:>26}{:>10}{:>11}{:>10}{:>11}'.format(
+                 'metric', 'mean', '{:.0%} interval'.format(confidence), 't', 'p', 'z', 'p')]
+    for k, metric in enumerate(METRICS):
+        lines.append('{:<15}{:>12.3f}{:>13.3f}{:>13.3f}{:>10.2f}{:>11.3g}{:>10.2f}{:>11.3g}'.format(
+            metric, differences[k].mean(), low[k], high[k], t[k], t_p[k], z[k], z_p[k]))
+    lines.append('')
+    lines.append('Mean metrics by satisfiability class (x-sudoku / sudoku stripe):')
+    lines.append('{:<13}{:>8}'.format('class', 'puzzles') + ''.join('{:>24}'.format(metric) for metric in METRICS))
+    for name, count, x_means, stripe_means in summarize_classes(columns):
+        lines.append('{:<13}{:>8}'.format(name, count)
+                     + ''.join('{:>24}'.format('{:.1f} / {:.1f}'.format(x_mean, stripe_mean))
+                               for x_mean, stripe_mean in zip(x_means, stripe_means)))
+    return '\n'.join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare x-sudoku and sudoku stripe difficulty in a metrics.csv.')
+    parser.add_argument('metrics', nargs='?', default='metrics.csv', help='metrics file of a run (default metrics.csv)')
+    parser.add_argument('--resamples', type=int, default=10000, help='number of bootstrap resamples (default 10000)')
+    parser.add_argument('--confidence', type=float, default=0.95, help='confidence level of the intervals (default 0.95)')
+    parser.add_argument('-j', '--workers', type=int, default=1,
+                        help='number of processes to spread the resamples over (0 = one per core)')
+    parser.add_argument('--seed', type=int, default=0, help='random seed of the resamples')
+    args = parser.parse_args()
+    print(analyze(args.metrics, args.resamples, args.confidence, args.workers or os.cpu_count(), args.seed))
+
+if __name__ == '__main__':
+    main()
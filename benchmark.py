@@ -0,0 +1,158 @@
+# Hunter McKnight
+# KRCourse 2017
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from extract import extract, encode, decode, compress, compress_all, decode_all, write_store
+from sat_encoding import encode_sudoku
+from solver import get_metrics, get_solution, render_rules, solve_cdcl, to_dimacs
+
+def timed(function, repeats):
+    """
+    (function, int) -> float
+
+    Call function repeats times and return the best time in seconds.
+    """
+
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def standin_output(metrics, model, satsolver = 'zchaff'):
+    """
+    ((bool, int, int, int), [int], str) -> [str]
+
+    Render a result in the output format of zchaff or cadical, split
+    into words as solve returns it, so the parsers can be timed
+    without either solver installed.
+    """
+
+    sat, level, decisions, conflicts = metrics
+    if satsolver == 'cadical':
+        lines = ['s SATISFIABLE' if sat else 's UNSATISFIABLE']
+        if sat:
+            lines.append('v ' + ' '.join(str(literal) for literal in model) + ' 0')
+        lines += ['c decisions: ' + str(decisions), 'c learned: ' + str(conflicts)]
+    else:
+        lines = ['Instance ' + ('Satisfiable' if sat else 'Unsatisfiable')]
+        if sat:
+            lines.append(' '.join(str(literal) for literal in model) + ' Random Seed Used 0')
+        lines += ['Max Decision Level ' + str(level), 'Num. of Decisions ' + str(decisions),
+                  'Added Conflict Clauses ' + str(conflicts), 'RESULT: ' + ('SAT' if sat else 'UNSAT')]
+    return '\n'.join(lines).split()
+
+def run(filename = 'sudoku17.txt', n_puzzles = 50, sizes = (9, 16), repeats = 3):
+    """
+    (str, int, (int), int) -> {str: float}
+
+    Time each stage of the pipeline separately and return the best
+    time in seconds of each stage, by name. Solving uses the built-in
+    CDCL solver on the first n_puzzles puzzles of the file, so no
+    external solver is needed.
+    """
+
+    results = {}
+
+    results['load/extract'] = timed(lambda: extract(filename), repeats)
+    with tempfile.TemporaryDirectory() as scratch:
+        store = os.path.join(scratch, 'puzzles.sdb')
+        write_store(store, extract(filename))
+        results['load/store'] = timed(lambda: extract(store), repeats)
+    puzzles = extract(filename)[:n_puzzles]
+    results['load/encode_givens'] = timed(lambda: [encode(puzzle) for puzzle in puzzles], repeats)
+    givens = [encode(puzzle) for puzzle in puzzles]
+
+    rules = {}
+    for size in sizes:
+        for variant in ('x', 'stripe'):
+            flags = {variant: True}
+            name = str(size) + 'x' + str(size) + '-' + variant
+            results['encode/lists/' + name] = timed(lambda: encode_sudoku(size, size, size, **flags), 1)
+            results['encode/vectorized/' + name] = timed(
+                lambda: encode_sudoku(size, size, size, vectorized = True, **flags), repeats)
+            rules[name] = encode_sudoku(size, size, size, vectorized = True, **flags)
+
+            results['serialize/rules/' + name] = timed(lambda: to_dimacs(rules[name]), repeats)
+
+    for variant in ('x', 'stripe'):
+        name = '9x9-' + variant
+        render_rules(rules[name])
+        results['serialize/givens/' + name] = timed(
+            lambda: [to_dimacs(puzzle, rules[name]) for puzzle in givens], repeats)
+
+        solved = []
+        results['solve/cdcl/' + name] = timed(
+            lambda: solved.extend(solve_cdcl(puzzle, rules[name])[:2] for puzzle in givens), 1)
+
+        for satsolver in ('zchaff', 'cadical'):
+            outputs = [standin_output(metrics, model, satsolver) for metrics, model in solved]
+            results['parse/' + satsolver + '/' + name] = timed(
+                lambda: [(get_metrics(output, satsolver), get_solution(output, satsolver) if metrics[0] else '')
+                         for output, (metrics, model) in zip(outputs, solved)],
+                repeats)
+
+        models = [model for metrics, model in solved if metrics[0]]
+        results['decode/' + name] = timed(lambda: [compress(decode(model)) for model in models], repeats)
+        results['decode/batch/' + name] = timed(lambda: compress_all(decode_all(models)), repeats)
+
+    return results
+
+def compare(results, baseline, tolerance = 0.2, noise = 0.001):
+    """
+    ({str: float}, {str: float}, float, float) -> [str]
+
+    Return a description of each stage that is more than tolerance
+    (a fraction) slower than in the baseline. Differences under noise
+    seconds are ignored, as timer jitter.
+    """
+
+    regressions = []
+    for stage in sorted(results):
+        if (stage in baseline and results[stage] > baseline[stage] * (1 + tolerance)
+                and results[stage] - baseline[stage] > noise):
+            regressions.append(stage + ': ' + '{:.4f}'.format(results[stage]) + 's, baseline '
+                               + '{:.4f}'.format(baseline[stage]) + 's')
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Time each stage of the x-sudoku / sudoku stripe pipeline.')
+    parser.add_argument('--puzzles', default='sudoku17.txt', help='file of puzzles (default sudoku17.txt)')
+    parser.add_argument('-n', type=int, default=50, help='number of puzzles to encode, solve and parse')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[9, 16], help='grid sizes to encode (9 is always included)')
+    parser.add_argument('--repeats', type=int, default=3, help='take the best of this many runs of each stage')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='compare against the results in this JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='flag stages slower than the baseline by more than this fraction')
+    args = parser.parse_args()
+
+    sizes = sorted(set([9] + args.sizes))
+    results = run(args.puzzles, args.n, sizes, args.repeats)
+    for stage in sorted(results):
+        print('{:<40}{:>10.4f}s'.format(stage, results[stage]))
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            regressions = compare(results, json.load(baseline), args.tolerance)
+        if regressions:
+            print('Slower than the baseline:')
+            for regression in regressions:
+                print('  ' + regression)
+            sys.exit(1)
+        print('No regressions against ' + args.baseline + '.')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,448 @@
+# Hunter McKnight
+# KRCourse 2017
+
+import heapq
+import time
+
+class CDCLSolver(object):
+    """
+    A conflict-driven clause learning SAT solver in pure Python, so
+    that every run reports the same metrics whether or not zChaff or
+    CaDiCaL is installed.
+
+    Literals are stored as integer codes, 2 * var for var and
+    2 * var + 1 for -var, so a literal's negation is code ^ 1. The
+    clause database is a list of literal code lists indexed by clause
+    number. Binary clauses, the bulk of a sudoku encoding, live in
+    per-literal implication lists; longer clauses are propagated with
+    two watched literals, kept in positions 0 and 1. Branching is
+    VSIDS with phase saving, conflicts are analysed to the first
+    unique implication point, and the solver restarts on the Luby
+    sequence.
+
+    Clauses can be added between calls to solve, and solve takes
+    assumptions, so one solver can be reused for many queries.
+    """
+
+    def __init__(self):
+        self.n_vars = 0
+        self.ok = True
+        # clause number -> literal codes
+        self.clauses = []
+        # literal code -> numbers of the long clauses watching it
+        self.watches = [[], []]
+        # literal code -> (other literal, clause number) of the binary
+        # clauses that become unit when the literal is false
+        self.binary = [[], []]
+        # literal code -> 1 true, -1 false, 0 unassigned
+        self.value = [0, 0]
+        self.level = [0]
+        self.reason = [None]
+        self.phase = [False]
+        self.activity = [0.0]
+        # only variables that occur in a clause are branched on
+        self.used = [False]
+        self.heap = []
+        self.increment = 1.0
+        self.trail = []
+        self.trail_lim = []
+        self.qhead = 0
+        self.model = None
+        self.stats = {'decisions': 0, 'conflicts': 0, 'learned': 0, 'propagations': 0,
+                      'max_level': 0, 'restarts': 0, 'time': 0.0}
+
+    def copy(self):
+        """
+        (None) -> CDCLSolver
+
+        Return an independent solver with the same clauses and
+        level 0 assignments, e.g. to reuse a loaded rule set.
+        """
+
+        other = CDCLSolver.__new__(CDCLSolver)
+        other.__dict__.update(self.__dict__)
+        other.clauses = [list(clause) for clause in self.clauses]
+        other.watches = [list(watch) for watch in self.watches]
+        other.binary = [list(implied) for implied in self.binary]
+        for name in ('value', 'level', 'reason', 'phase', 'activity', 'used', 'heap', 'trail', 'trail_lim'):
+            setattr(other, name, list(getattr(self, name)))
+        other.stats = dict(self.stats)
+        return other
+
+    def new_var(self, var):
+        """
+        (int) -> None
+
+        Make sure variables up to var exist.
+        """
+
+        while self.n_vars < var:
+            self.n_vars += 1
+            self.watches += [[], []]
+            self.binary += [[], []]
+            self.value += [0, 0]
+            self.level.append(0)
+            self.reason.append(None)
+            self.phase.append(False)
+            self.activity.append(0.0)
+            self.used.append(False)
+
+    def add_clause(self, clause):
+        """
+        ([int]) -> bool
+
+        Add a clause of DIMACS literals. Return False if the
+        clauses are now known to be unsatisfiable.
+        """
+
+        if not self.ok:
+            return False
+        self.cancel_until(0)
+        codes = []
+        for literal in clause:
+            literal = int(literal)
+            self.new_var(abs(literal))
+            if not self.used[abs(literal)]:
+                self.used[abs(literal)] = True
+                heapq.heappush(self.heap, (-self.activity[abs(literal)], abs(literal)))
+            code = 2 * literal if literal > 0 else -2 * literal + 1
+            if self.value[code] == 1 or code ^ 1 in codes:
+                # satisfied at level 0, or a tautology
+                return True
+            if self.value[code] == 0 and code not in codes:
+                codes.append(code)
+
+        if not codes:
+            self.ok = False
+        elif len(codes) == 1:
+            self.assign(codes[0], None)
+        else:
+            self.attach(codes)
+        return self.ok
+
+    def add_clauses(self, clauses):
+        """
+        ([[int]]) -> bool
+
+        Add each of the clauses.
+        """
+
+        for clause in clauses:
+            self.add_clause(clause)
+        return self.ok
+
+    def attach(self, codes):
+        """
+        ([int]) -> int
+
+        Store a clause of two or more literal codes and return its number.
+        """
+
+        number = len(self.clauses)
+        self.clauses.append(codes)
+        if len(codes) == 2:
+            self.binary[codes[0]].append((codes[1], number))
+            self.binary[codes[1]].append((codes[0], number))
+        else:
+            self.watches[codes[0]].append(number)
+            self.watches[codes[1]].append(number)
+        return number
+
+    def assign(self, code, reason):
+        """
+        (int, int) -> None
+
+        Make a literal true at the current decision level.
+        """
+
+        var = code >> 1
+        self.value[code] = 1
+        self.value[code ^ 1] = -1
+        self.level[var] = len(self.trail_lim)
+        self.reason[var] = reason
+        self.trail.append(code)
+
+    def propagate(self):
+        """
+        (None) -> int
+
+        Propagate all assignments on the trail. Return the number of
+        a conflicting clause, or None.
+        """
+
+        value = self.value
+        binary = self.binary
+        watches = self.watches
+        clauses = self.clauses
+        trail = self.trail
+        assign = self.assign
+        conflict = None
+
+        while self.qhead < len(trail):
+            false_code = trail[self.qhead] ^ 1
+            self.qhead += 1
+            self.stats['propagations'] += 1
+
+            for other, number in binary[false_code]:
+                other_value = value[other]
+                if other_value == 0:
+                    assign(other, number)
+                elif other_value == -1:
+                    return number
+
+            watching = watches[false_code]
+            kept = 0
+            i = 0
+            while i < len(watching):
+                number = watching[i]
+                i += 1
+                clause = clauses[number]
+                # keep the false literal in position 1
+                if clause[0] == false_code:
+                    clause[0] = clause[1]
+                    clause[1] = false_code
+                first = clause[0]
+                if value[first] == 1:
+                    watching[kept] = number
+                    kept += 1
+                    continue
+                for k in range(2, len(clause)):
+                    if value[clause[k]] != -1:
+                        clause[1] = clause[k]
+                        clause[k] = false_code
+                        watches[clause[1]].append(number)
+                        break
+                else:
+                    watching[kept] = number
+                    kept += 1
+                    if value[first] == -1:
+                        conflict = number
+                        while i < len(watching):
+                            watching[kept] = watching[i]
+                            kept += 1
+                            i += 1
+                    else:
+                        assign(first, number)
+            del watching[kept:]
+            if conflict is not None:
+                return conflict
+
+        return None
+
+    def analyze(self, conflict):
+        """
+        (int) -> ([int], int)
+
+        Learn a clause from a conflict, asserting at the first unique
+        implication point. Return the clause, asserting literal first,
+        and the level to jump back to.
+        """
+
+        level = self.level
+        reason = self.reason
+        trail = self.trail
+        current = len(self.trail_lim)
+        seen = set()
+        learned = [None]
+        pending = 0
+        code = None
+        index = len(trail) - 1
+
+        while True:
+            for other in self.clauses[conflict]:
+                if other == code:
+                    continue
+                var = other >> 1
+                if var not in seen and level[var] > 0:
+                    seen.add(var)
+                    self.bump(var)
+                    if level[var] == current:
+                        pending += 1
+                    else:
+                        learned.append(other)
+            # the next literal on the trail that takes part
+            while trail[index] >> 1 not in seen:
+                index -= 1
+            code = trail[index]
+            index -= 1
+            conflict = reason[code >> 1]
+            pending -= 1
+            if pending == 0:
+                break
+        learned[0] = code ^ 1
+
+        # drop literals implied by the rest of the clause
+        minimal = [learned[0]]
+        for other in learned[1:]:
+            because = reason[other >> 1]
+            if because is None or any(
+                    (implied >> 1) not in seen and level[implied >> 1] > 0
+                    for implied in self.clauses[because] if implied != other ^ 1):
+                minimal.append(other)
+
+        if len(minimal) == 1:
+            return minimal, 0
+        # watch the literal of the highest level in position 1
+        deepest = max(range(1, len(minimal)), key=lambda k: level[minimal[k] >> 1])
+        minimal[1], minimal[deepest] = minimal[deepest], minimal[1]
+        return minimal, level[minimal[1] >> 1]
+
+    def bump(self, var):
+        """
+        (int) -> None
+
+        Raise a variable's VSIDS activity.
+        """
+
+        self.activity[var] += self.increment
+        if self.activity[var] > 1e100:
+            # rescale everything to avoid overflow
+            self.activity = [activity * 1e-100 for activity in self.activity]
+            self.increment *= 1e-100
+            self.heap = [(-self.activity[var], var) for var in range(1, self.n_vars + 1)
+                         if self.used[var] and self.value[2 * var] == 0]
+            heapq.heapify(self.heap)
+        elif self.value[2 * var] == 0:
+            heapq.heappush(self.heap, (-self.activity[var], var))
+
+    def cancel_until(self, target):
+        """
+        (int) -> None
+
+        Undo all assignments above the target decision level.
+        """
+
+        if len(self.trail_lim) <= target:
+            return
+        start = self.trail_lim[target]
+        for code in self.trail[start:]:
+            var = code >> 1
+            self.value[code] = 0
+            self.value[code ^ 1] = 0
+            self.reason[var] = None
+            self.phase[var] = not code & 1
+            heapq.heappush(self.heap, (-self.activity[var], var))
+        del self.trail[start:]
+        del self.trail_lim[target:]
+        self.qhead = start
+
+    def pick(self):
+        """
+        (None) -> int
+
+        Return the literal code of the unassigned variable of highest
+        activity in its saved phase, or None if all are assigned.
+        """
+
+        heap = self.heap
+        while heap:
+            activity, var = heapq.heappop(heap)
+            if self.value[2 * var] == 0 and -activity == self.activity[var]:
+                return 2 * var if self.phase[var] else 2 * var + 1
+        return None
+
+    def solve(self, assumptions=(), time_limit=None):
+        """
+        ([int], float) -> bool
+
+        Decide the clauses under the given DIMACS literals. Statistics
+        in self.stats accumulate over calls; the model of a
+        satisfiable call is left in self.model. If time_limit seconds
+        pass first, give up and return None.
+        """
+
+        start = time.time()
+        self.model = None
+        stats = self.stats
+        if self.ok and self.propagate() is not None:
+            self.ok = False
+        if not self.ok:
+            stats['time'] += time.time() - start
+            return False
+
+        assumed = []
+        for literal in assumptions:
+            literal = int(literal)
+            self.new_var(abs(literal))
+            assumed.append(2 * literal if literal > 0 else -2 * literal + 1)
+
+        restart = 1
+        budget = luby(restart) * 100
+        sat = None
+        while sat is None:
+            conflict = self.propagate()
+            if conflict is not None:
+                stats['conflicts'] += 1
+                if not self.trail_lim:
+                    self.ok = False
+                    sat = False
+                    break
+                learned, back = self.analyze(conflict)
+                self.cancel_until(back)
+                stats['learned'] += 1
+                if len(learned) == 1:
+                    self.assign(learned[0], None)
+                else:
+                    self.assign(learned[0], self.attach(learned))
+                self.increment /= 0.95
+                budget -= 1
+                if time_limit is not None and stats['conflicts'] % 100 == 0 and time.time() - start > time_limit:
+                    break
+                continue
+
+            if budget <= 0:
+                stats['restarts'] += 1
+                restart += 1
+                budget = luby(restart) * 100
+                self.cancel_until(0)
+                continue
+
+            # assumptions come first, one decision level each
+            code = None
+            while len(self.trail_lim) < len(assumed):
+                candidate = assumed[len(self.trail_lim)]
+                if self.value[candidate] == -1:
+                    sat = False
+                    break
+                self.trail_lim.append(len(self.trail))
+                if self.value[candidate] == 0:
+                    code = candidate
+                    break
+            if sat is not None:
+                break
+            if code is None:
+                code = self.pick()
+                if code is None:
+                    sat = True
+                    break
+                self.trail_lim.append(len(self.trail))
+                stats['decisions'] += 1
+            stats['max_level'] = max(stats['max_level'], len(self.trail_lim))
+            self.assign(code, None)
+
+        if sat:
+            self.model = [var if self.value[2 * var] == 1 else -var for var in range(1, self.n_vars + 1)]
+        self.cancel_until(0)
+        stats['time'] += time.time() - start
+        return sat
+
+def luby(i):
+    """
+    (int) -> int
+
+    Return the i-th element (from 1) of the Luby restart sequence
+    1, 1, 2, 1, 1, 2, 4, ...
+    """
+
+    # as in MiniSat
+    x = i - 1
+    size = 1
+    seq = 0
+    while size < x + 1:
+        seq += 1
+        size = 2 * size + 1
+    while size - 1 != x:
+        size = (size - 1) >> 1
+        seq -= 1
+        x = x % size
+    return 2 ** seq
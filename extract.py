@@ -1,14 +1,192 @@
 # Hunter McKnight
 # KRCourse 2017
 
+import argparse
+import itertools
+import os
 import numpy as np
 
-def extract():
+def puzzle_layout(data, size=9):
     """
-    (None) -> np.array
+    (np.array, int) -> (int, int)
 
-    Given a .txt of 49151 minimal 9x9 sudoku puzzles and their solutions,
-    export the puzzles into a numpy array.
+    Given the raw bytes of a puzzle file with one puzzle of size x size
+    digits per line, return the number of puzzles in the file and the
+    length of each line including its line break.
+    """
+
+    n_cells = size * size
+    if len(data) < n_cells:
+        return 0, n_cells + 1
+
+    # lines end in either \n or \r\n
+    stride = n_cells + 1
+    if len(data) > n_cells and data[n_cells] == ord('\r'):
+        stride += 1
+
+    # the last line need not end in a line break
+    n_puzzles = (len(data) + stride - n_cells) // stride
+    return n_puzzles, stride
+
+# the first bytes of a puzzle store (see write_store)
+STORE_MAGIC = b'SDKB'
+STORE_VERSION = 1
+# magic, version, grid size, bits per cell, reserved byte, number of puzzles
+STORE_HEADER = np.dtype([('magic', 'S4'), ('version', 'u1'), ('size', 'u1'), ('bits', 'u1'), ('reserved', 'u1'),
+                         ('count', '<u8')])
+
+def is_store(filename):
+    """
+    (str) -> bool
+
+    Return whether a puzzle file is a binary puzzle store rather
+    than text.
+    """
+
+    with open(filename, 'rb') as store:
+        return store.read(len(STORE_MAGIC)) == STORE_MAGIC
+
+def write_store(filename, puzzles):
+    """
+    (str, np.array) -> None
+
+    Write an (N, size, size) array of puzzles to a binary puzzle
+    store: a 16-byte header with the grid size, the bits per cell and
+    the number of puzzles, followed by one fixed-length record per
+    puzzle, so puzzle i is found at a computed offset without an
+    index. Grids up to 15x15 are packed two cells to a byte, larger
+    ones (up to 255x255) one cell to a byte.
+    """
+
+    puzzles = np.asarray(puzzles)
+    size = puzzles.shape[1]
+    if puzzles.ndim != 3 or puzzles.shape[2] != size or not 0 < size < 256:
+        raise ValueError('puzzles must be an (N, size, size) array with size below 256')
+    if puzzles.size and (puzzles.min() < 0 or puzzles.max() > size):
+        raise ValueError('puzzle values must be between 0 and ' + str(size))
+    bits = 4 if size < 16 else 8
+    flat = puzzles.reshape((len(puzzles), size * size)).astype(np.uint8)
+    if bits == 4:
+        if flat.shape[1] % 2:
+            flat = np.hstack([flat, np.zeros((len(flat), 1), np.uint8)])
+        flat = (flat[:, 0::2] << 4) | flat[:, 1::2]
+
+    header = np.zeros(1, STORE_HEADER)
+    header[0] = (STORE_MAGIC, STORE_VERSION, size, bits, 0, len(puzzles))
+    with open(filename, 'wb') as store:
+        store.write(header.tobytes())
+        store.write(flat.tobytes())
+
+def open_store(filename):
+    """
+    (str) -> (np.memmap, int, int)
+
+    Memory-map a binary puzzle store and return its records, one row
+    of bytes per puzzle, with the grid size and bits per cell. Nothing
+    is read until records are used.
+    """
+
+    header = np.fromfile(filename, STORE_HEADER, count=1)
+    if len(header) == 0 or header['magic'][0] != STORE_MAGIC:
+        raise ValueError(filename + ' is not a puzzle store')
+    if header['version'][0] != STORE_VERSION:
+        raise ValueError(filename + ': unknown puzzle store version ' + str(header['version'][0]))
+    size, bits, count = int(header['size'][0]), int(header['bits'][0]), int(header['count'][0])
+    record = (size * size * bits + 7) // 8
+    if count == 0:
+        return np.zeros((0, record), np.uint8), size, bits
+    records = np.memmap(filename, dtype=np.uint8, mode='r', offset=STORE_HEADER.itemsize, shape=(count, record))
+    return records, size, bits
+
+def unpack_records(records, size, bits):
+    """
+    (np.array, int, int) -> np.array
+
+    Unpack records of a puzzle store into an (N, size, size) array.
+    """
+
+    records = np.asarray(records)
+    if bits == 4:
+        cells = np.empty((len(records), records.shape[1] * 2), np.uint8)
+        cells[:, 0::2] = records >> 4
+        cells[:, 1::2] = records & 0x0F
+        records = cells[:, :size * size]
+    return records.astype(np.int32).reshape((-1, size, size))
+
+def iter_puzzles(filename='sudoku17.txt', batch_size=10000, size=9, start=0, stop=None):
+    """
+    (str, int, int, int, int) -> generator of np.array
+
+    Memory-map a .txt of size x size sudoku puzzles, one per line with
+    0 for blanks, or a binary puzzle store (see write_store), and
+    yield the puzzles as numpy arrays of shape (batch_size, size,
+    size); the last batch may be shorter. With batch_size None, yield
+    all puzzles in one batch. Only puzzles start to stop (by default
+    all) are read; lines have a fixed length, so skipping to start
+    costs nothing.
+
+    Only the current batch is held in memory, so the file may be
+    larger than RAM.
+    """
+
+    n_cells = size * size
+    if os.path.getsize(filename) == 0:
+        return
+    if is_store(filename):
+        records, store_size, bits = open_store(filename)
+        if store_size != size:
+            raise ValueError(filename + ' holds ' + str(store_size) + 'x' + str(store_size) + ' puzzles, not '
+                             + str(size) + 'x' + str(size))
+        stop = len(records) if stop is None else min(stop, len(records))
+        if batch_size is None:
+            batch_size = max(stop - start, 1)
+        for first in range(start, stop, batch_size):
+            yield unpack_records(records[first:min(first + batch_size, stop)], size, bits)
+        return
+
+    data = np.memmap(filename, dtype=np.uint8, mode='r')
+    n_puzzles, stride = puzzle_layout(data, size)
+    if stop is not None:
+        n_puzzles = min(stop, n_puzzles)
+    if batch_size is None:
+        batch_size = max(n_puzzles - start, 1)
+
+    for first in range(start, n_puzzles, batch_size):
+        count = min(batch_size, n_puzzles - first)
+        # pad the last line in case it has no line break
+        raw = np.zeros(count * stride, np.uint8)
+        chunk = data[first * stride:(first + count) * stride]
+        raw[:len(chunk)] = chunk
+        lines = raw.reshape((count, stride))[:, :n_cells]
+
+        puzzles = lines.astype(np.int32) - ord('0')
+        if ((puzzles < 0) | (puzzles > 9)).any():
+            bad = first + int(np.nonzero(((puzzles < 0) | (puzzles > 9)).any(axis=1))[0][0])
+            raise ValueError(filename + ': line ' + str(bad + 1) + ' is not a ' + str(size) + 'x' + str(size) + ' puzzle')
+        yield puzzles.reshape((-1, size, size))
+
+def count_puzzles(filename='sudoku17.txt', size=9):
+    """
+    (str, int) -> int
+
+    Return the number of puzzles in a puzzle file or store without
+    reading it.
+    """
+
+    if os.path.getsize(filename) == 0:
+        return 0
+    if is_store(filename):
+        return len(open_store(filename)[0])
+    return puzzle_layout(np.memmap(filename, dtype=np.uint8, mode='r'), size)[0]
+
+def extract(filename='sudoku17.txt'):
+    """
+    (str) -> np.array
+
+    Given a .txt of minimal 9x9 sudoku puzzles, one per line, or a
+    puzzle store, export the puzzles into a numpy array. The number
+    of puzzles is taken from the file; use iter_puzzles to read large
+    files in batches.
 
     Modified from Bryan Park's script to extract puzzles from his sudoku dataset
     on Kaggle.
@@ -20,17 +198,9 @@ def extract():
     http://staffhome.ecm.uwa.edu.au/~00013890/sudokumin.php
     """
 
-    # Test only an x or stripe sudoku
-    # n_sudokus = 3
-    # puzzles = np.zeros((n_sudokus, 81), np.int32)
-    # for i, line in enumerate(open('stripe_test_sudoku.csv', 'r').read().splitlines()[1:]):
-    # for i, line in enumerate(open('x_test_sudoku.csv', 'r').read().splitlines()):
-    puzzles = np.zeros((49151, 81), np.int32)
-    for i, line in enumerate(open('sudoku17.txt', 'r').read().splitlines()):
-        for j, p in enumerate(line):
-            puzzles[i, j] = p
-    puzzles = puzzles.reshape((-1, 9, 9))
-    return puzzles
+    for puzzles in iter_puzzles(filename, batch_size=None):
+        return puzzles
+    return np.zeros((0, 9, 9), np.int32)
 
 def compress(puzzle):
     """
@@ -40,14 +210,40 @@ def compress(puzzle):
     as a single line of text suitable for storing in a .csv file.
     """
 
-    puzzle_str = ''
+    return compress_all(np.asarray(puzzle)[np.newaxis])[0]
+
+def compress_all(puzzles):
+    """
+    (np.array) -> [str]
 
-    for row in puzzle:
-        for col in row:
-            puzzle_str += str(col)
+    Given an (N, rows, columns) array of puzzles or solutions,
+    rewrite each as compress does, all at once.
+    """
+
+    puzzles = np.asarray(puzzles)
+    if len(puzzles) == 0:
+        return []
+    flat = puzzles.reshape((len(puzzles), -1))
+    if flat.size and (flat.min() < 0 or flat.max() > 9):
+        # numbers of more than one digit are written out one by one
+        return [''.join([str(number) for number in row]) for row in flat.tolist()]
+    text = (flat + ord('0')).astype(np.uint8).tobytes().decode('ascii')
+    width = flat.shape[1]
+    return [text[i:i + width] for i in range(0, len(text), width)]
+
+def write_solutions(output, indices, puzzles, solutions):
+    """
+    (file, [int], np.array, np.array) -> None
 
-    return puzzle_str
+    Write a row of puzzle index, puzzle and solution for each
+    puzzle to an open .csv file in one write, in the format of
+    csv.writer.
+    """
 
+    if len(indices) == 0:
+        return
+    output.write(''.join([str(i) + ',' + puzzle + ',' + solution + '\r\n' for i, puzzle, solution
+                          in zip(indices, compress_all(puzzles), compress_all(solutions))]))
 
 def encode(puzzle):
     """
@@ -88,19 +284,49 @@ def decode(var_list):
     ([str]) -> np.array
 
     Given a zchaff model for a satisfiable puzzle, return the solution as
+    a 9x9 numpy array.
+    """
+
+    return decode_all([var_list])[0]
+
+def decode_all(models, n_rows=9, n_columns=9, n_numbers=9):
     """
+    ([[str]], int, int, int) -> np.array
+
+    Given models of the cell variables of sat_encoding.create_variables,
+    as solvers (words) or the result cache (ints) report them, return
+    the solutions as an (N, n_rows, n_columns) array. Cells without a true variable, e.g.
+    all cells of an empty model, are 0.
+    """
+
+    solutions = np.zeros((len(models), n_rows * n_columns), np.int32)
+    lengths = [len(model) for model in models]
+    if sum(lengths) == 0:
+        return solutions.reshape((len(models), n_rows, n_columns))
 
-    solution = np.zeros((9, 9), np.int32)
+    # models from solvers are words and models from the result cache
+    # ints, and a group may hold both
+    literals = itertools.chain.from_iterable(models)
+    variables = np.fromiter(map(int, literals), np.int64, sum(lengths))
+    owners = np.repeat(np.arange(len(models)), lengths)
+    # negative literals tell us what numbers don't go in a cell;
+    # we only care what numbers actually are in a cell
+    true = (variables > 0) & (variables <= n_rows * n_columns * n_numbers)
+    cells, numbers = np.divmod(variables[true] - 1, n_numbers)
+    solutions[owners[true], cells] = numbers + 1
 
-    for var in var_list:
-        # negative clauses tell us what numbers don't go in a cell
-        # we only care what numbers actually are in a cell
-        var = int(var)
-        if var > 0 and var < 730:
-            cell = ((var - 1) % 9) + 1
-            col = ((var - cell) % 81) // 9
-            row = ((var - (col * 9) - cell)) // 81
+    return solutions.reshape((len(models), n_rows, n_columns))
 
-            solution[row][col] = cell
+def main():
+    parser = argparse.ArgumentParser(description='Convert a text file of puzzles to a binary puzzle store.')
+    parser.add_argument('puzzles', help='text file of puzzles, one per line')
+    parser.add_argument('store', help='puzzle store to write')
+    parser.add_argument('--size', type=int, default=9, help='grid size (default 9)')
+    args = parser.parse_args()
+    puzzles = np.concatenate([np.zeros((0, args.size, args.size), np.int32)]
+                             + list(iter_puzzles(args.puzzles, size=args.size)))
+    write_store(args.store, puzzles)
+    print('Wrote ' + str(len(puzzles)) + ' puzzles to ' + args.store + '.')
 
-    return solution
+if __name__ == '__main__':
+    main()
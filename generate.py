@@ -0,0 +1,196 @@
+# Hunter McKnight
+# KRCourse 2017
+
+import argparse
+import multiprocessing
+import os
+import numpy as np
+import pycosat
+from extract import compress_all, decode, encode
+from sat_encoding import encode_sudoku
+from solver import count_models, pycosat_clauses
+
+try:
+    from pysat.solvers import Solver
+except ImportError:
+    # without python-sat, every check is a fresh pycosat call
+    Solver = None
+
+# the rule sets puzzles can be generated for
+RULES = ('x', 'stripe')
+
+# state of the current worker process, filled in by init_generator
+_worker = {}
+
+class PuzzleGenerator(object):
+    """
+    Generates minimal puzzles with a unique solution under one rule
+    set: a random solution grid is found, then its clues are removed
+    one at a time in random order, and a removal is kept only if the
+    solution stays unique.
+
+    For the uniqueness checks, the rules are loaded once into a
+    long-lived python-sat solver. Givens are passed as assumptions,
+    and the clause ruling out the current solution is switched on by
+    an activation literal, so the cnf is never rebuilt between checks.
+    Without python-sat, each check is a separate pycosat call. Their
+    verdicts do not depend on the solver's history; solution grids,
+    whose models would, are always found with a fresh pycosat call.
+    """
+
+    def __init__(self, rules, name='cadical153', seed=None):
+        self.rules = rules
+        self.random = np.random.RandomState(seed)
+        self.next_variable = rules.max_variable() + 1
+        if Solver is None:
+            self.solver = None
+        else:
+            self.solver = Solver(name=name)
+            for clause in rules.to_lists():
+                self.solver.add_clause(clause)
+
+    def solve(self, assumptions):
+        """
+        ([int]) -> [int]
+
+        Return a model of the rules under the assumed literals, or
+        None if there is none. Each call is a fresh pycosat run, so
+        the model depends on the assumptions alone and not on the
+        checks the long-lived solver made before.
+        """
+
+        model = pycosat.solve(pycosat_clauses([[literal] for literal in assumptions], self.rules))
+        return None if model == 'UNSAT' else model
+
+    def random_solution(self, n_seeds=11):
+        """
+        (int) -> np.array
+
+        Return a random solution grid: n_seeds random cells get
+        random numbers, and the rules are solved from there, until
+        the seeds are consistent.
+        """
+
+        while True:
+            cells = self.random.choice(81, n_seeds, replace=False)
+            numbers = self.random.randint(1, 10, n_seeds)
+            model = self.solve((cells * 9 + numbers).tolist())
+            if model is not None:
+                return decode(model)
+
+    def minimize(self, solution):
+        """
+        (np.array) -> np.array
+
+        Remove the clues of a solution grid in random order, keeping
+        each removal that leaves the solution unique, and return the
+        resulting puzzle. Since removing clues never makes a puzzle
+        more constrained, a clue that had to stay stays needed, so
+        one pass leaves a minimal puzzle.
+        """
+
+        givens = [int(clause[0]) for clause in encode(solution)]
+        if self.solver is None:
+            check = None
+        else:
+            check = self.next_variable
+            self.next_variable += 1
+            # with check assumed, the known solution is ruled out
+            self.solver.add_clause([-check] + [-literal for literal in givens])
+
+        kept = np.ones(81, bool)
+        for cell in self.random.permutation(81):
+            kept[cell] = False
+            assumptions = [givens[i] for i in np.nonzero(kept)[0]]
+            if self.solver is None:
+                unique = count_models([[literal] for literal in assumptions], self.rules, 2) == 1
+            else:
+                unique = not self.solver.solve(assumptions=assumptions + [check])
+            if not unique:
+                kept[cell] = True
+
+        if check is not None:
+            # retire the activation literal for good
+            self.solver.add_clause([-check])
+        return np.where(kept.reshape((9, 9)), solution, 0)
+
+    def generate(self):
+        """
+        (None) -> np.array
+
+        Return a new minimal puzzle.
+        """
+
+        return self.minimize(self.random_solution())
+
+def init_generator(rules='x', name='cadical153', seed=None):
+    """
+    (str, str, int) -> None
+
+    Prepare the current process to generate puzzles for a rule set,
+    with its own solver.
+    """
+
+    if rules not in RULES:
+        raise ValueError('unknown rules ' + repr(rules) + '; choose from ' + ', '.join(RULES))
+    encoding = encode_sudoku(9, 9, 9, x = rules == 'x', stripe = rules == 'stripe', vectorized = True)
+    _worker['generator'] = PuzzleGenerator(encoding, name, seed)
+
+def generate_puzzle(seed):
+    """
+    (int) -> np.array
+
+    Generate one puzzle with the current worker's generator, from
+    the given random seed.
+    """
+
+    generator = _worker['generator']
+    generator.random.seed(seed)
+    return generator.generate()
+
+def generate(n_puzzles, rules='x', output_file='generated.txt', workers=1, seed=0, name='cadical153'):
+    """
+    (int, str, str, int, int, str) -> None
+
+    Generate n_puzzles minimal puzzles with unique solutions under
+    the rules ('x' or 'stripe') and append them to output_file, one
+    per line as 81 digits with 0 for blanks, as in sudoku17.txt.
+    Puzzle i is generated from random seed seed + i, so the output
+    does not depend on the number of workers.
+    """
+
+    seeds = range(seed, seed + n_puzzles)
+    if workers > 1:
+        pool = multiprocessing.Pool(workers, init_generator, (rules, name))
+        # imap keeps the puzzles in seed order
+        puzzles = pool.imap(generate_puzzle, seeds, chunksize=4)
+    else:
+        init_generator(rules, name)
+        puzzles = map(generate_puzzle, seeds)
+
+    with open(output_file, 'a') as output:
+        batch = []
+        for i, puzzle in enumerate(puzzles):
+            batch.append(puzzle)
+            if len(batch) == 100 or i == n_puzzles - 1:
+                output.write(''.join(line + '\n' for line in compress_all(batch)))
+                output.flush()
+                batch = []
+                print(str(i + 1) + ' of ' + str(n_puzzles) + ' puzzles generated.')
+    if workers > 1:
+        pool.close()
+        pool.join()
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate minimal x-sudoku or sudoku stripe puzzles with unique solutions.')
+    parser.add_argument('n', type=int, help='number of puzzles to generate')
+    parser.add_argument('--rules', choices=RULES, default='x', help='rules the puzzles must be unique under (default x)')
+    parser.add_argument('--output', default='generated.txt', help='file to append the puzzles to (default generated.txt)')
+    parser.add_argument('-j', '--workers', type=int, default=1, help='number of worker processes (0 = one per core)')
+    parser.add_argument('--seed', type=int, default=0, help='random seed of the first puzzle')
+    parser.add_argument('--solver', default='cadical153', help='python-sat solver to use (default cadical153)')
+    args = parser.parse_args()
+    generate(args.n, args.rules, args.output, args.workers or os.cpu_count(), args.seed, args.solver)
+
+if __name__ == '__main__':
+    main()
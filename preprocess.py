@@ -0,0 +1,80 @@
+# Hunter McKnight
+# KRCourse 2017
+
+import numpy as np
+from sat_encoding import ClauseStore, concatenate_clauses
+
+def propagate_givens(rules, givens):
+    """
+    ([[int]], [[int]]) -> (ClauseStore, np.array, np.array)
+
+    Unit-propagate a puzzle's givens through the rules: each given
+    rules out its value in the cell and in the cell's row, column,
+    block and diagonal peers, which may fix further cells, and so on.
+    Return the clauses that are not yet satisfied with fixed literals
+    removed and variables renumbered densely from 1, an array whose
+    entry j - 1 is the original variable of new variable j, and the
+    array of fixed original literals. Return None if propagation
+    finds a conflict, i.e. the puzzle is unsatisfiable.
+    """
+
+    store = concatenate_clauses([rules, givens])
+    literals = store.literals.astype(np.int64)
+    starts = store.offsets[:-1]
+    lengths = np.diff(store.offsets)
+    if len(literals) == 0:
+        return store, np.zeros(0, np.int64), np.zeros(0, np.int64)
+    variables = np.abs(literals)
+    signs = np.sign(literals).astype(np.int8)
+    # variable -> 1 true, -1 false, 0 unassigned
+    value = np.zeros(variables.max() + 1, np.int8)
+
+    while True:
+        # literal -> 1 true, -1 false, 0 unassigned
+        literal_value = value[variables] * signs
+        satisfied = np.logical_or.reduceat(literal_value == 1, starts)
+        free = np.add.reduceat(literal_value == 0, starts)
+        if (~satisfied & (free == 0)).any():
+            return None
+        unit = ~satisfied & (free == 1)
+        if not unit.any():
+            break
+        implied = literals[(literal_value == 0) & np.repeat(unit, lengths)]
+        implied_variables = np.abs(implied)
+        value[implied_variables] = np.sign(implied)
+        # two unit clauses may imply opposite literals
+        if (value[implied_variables] != np.sign(implied)).any():
+            return None
+
+    keep = np.repeat(~satisfied, lengths) & (literal_value == 0)
+    remaining = literals[keep]
+    offsets = np.zeros(np.count_nonzero(~satisfied) + 1, np.int64)
+    np.cumsum(np.add.reduceat(keep, starts)[~satisfied], out = offsets[1:])
+
+    # number the remaining variables densely
+    original = np.unique(np.abs(remaining))
+    renumber = np.zeros(len(value), np.int64)
+    renumber[original] = np.arange(1, len(original) + 1)
+    simplified = ClauseStore(np.sign(remaining) * renumber[np.abs(remaining)], offsets)
+
+    fixed_variables = np.nonzero(value)[0]
+    fixed = fixed_variables * value[fixed_variables]
+    return simplified, original, fixed
+
+def expand_model(model, original, fixed):
+    """
+    ([int], np.array, np.array) -> [int]
+
+    Map a model of the simplified clauses back to the original
+    variables, adding the fixed literals. Variables that were neither
+    fixed nor kept are set false.
+    """
+
+    n_vars = max(int(original.max()) if len(original) else 0,
+                 int(np.abs(fixed).max()) if len(fixed) else 0)
+    value = np.full(n_vars + 1, -1, np.int64)
+    model = np.array([int(literal) for literal in model], np.int64)
+    model = model[np.abs(model) <= len(original)]
+    value[original[np.abs(model) - 1]] = np.sign(model)
+    value[np.abs(fixed)] = np.sign(fixed)
+    return (np.arange(1, n_vars + 1) * value[1:]).tolist()
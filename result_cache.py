@@ -0,0 +1,134 @@
+# Hunter McKnight
+# KRCourse 2017
+
+import hashlib
+import sqlite3
+import numpy as np
+from extract import compress, decode
+
+class ResultCache(object):
+    """
+    A persistent store of solver results in a local SQLite file, so
+    reruns with the same puzzles, rules and solver skip the solver.
+
+    Results are keyed by (puzzle, rules, solver) strings; see
+    puzzle_key for the first. Several processes may share one file.
+    """
+
+    def __init__(self, path='results.sqlite'):
+        self.connection = sqlite3.connect(path, timeout=60)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS results ('
+                                'puzzle TEXT, rules TEXT, solver TEXT, '
+                                'satisfiable INTEGER, max_level INTEGER, decisions INTEGER, conflicts INTEGER, '
+                                'solution TEXT, '
+                                'PRIMARY KEY (puzzle, rules, solver))')
+        self.connection.commit()
+
+    def get(self, key):
+        """
+        ((str, str, str)) -> ((bool, int, int, int), [int])
+
+        Return the metrics and solution stored for a key, or None. The
+        solution lists the true cell variables, as decode expects.
+        """
+
+        row = self.connection.execute('SELECT satisfiable, max_level, decisions, conflicts, solution FROM results '
+                                      'WHERE puzzle = ? AND rules = ? AND solver = ?', key).fetchone()
+        if row is None:
+            return None
+        metrics = (bool(row[0]), row[1], row[2], row[3])
+        if not row[4]:
+            return metrics, ''
+        cells = np.array([int(cell) for cell in row[4]]).reshape((9, 9))
+        rows, columns = np.nonzero(cells)
+        return metrics, (rows * 81 + columns * 9 + cells[rows, columns]).tolist()
+
+    def put(self, key, metrics, solution):
+        """
+        ((str, str, str), (bool, int, int, int), [str]) -> None
+
+        Store the metrics and, if satisfiable, the solution for a key.
+        """
+
+        solution = compress(decode(solution)) if metrics[0] else ''
+        self.connection.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                key + (int(metrics[0]), metrics[1], metrics[2], metrics[3], solution))
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+def puzzle_key(puzzle):
+    """
+    (np.array) -> str
+
+    Return a hash identifying a puzzle.
+    """
+
+    return hashlib.sha1(compress(puzzle).encode()).hexdigest()
+
+def dihedral(grid, k):
+    """
+    (np.array, int) -> np.array
+
+    Apply the k-th of the 8 rotations and reflections of the square.
+    """
+
+    if k >= 4:
+        grid = grid.T
+    return np.rot90(grid, k % 4)
+
+def undo_dihedral(grid, k):
+    """
+    (np.array, int) -> np.array
+
+    Invert dihedral(grid, k).
+    """
+
+    grid = np.rot90(grid, -(k % 4))
+    if k >= 4:
+        grid = grid.T
+    return grid
+
+def canonicalize(puzzle):
+    """
+    (np.array) -> (np.array, (int, np.array))
+
+    Return a canonical representative of the puzzle's class under
+    rotations, reflections and relabelling of the digits, together
+    with the transformation that produced it. These symmetries map
+    sudoku and x-sudoku puzzles to equivalent puzzles (but not sudoku
+    stripe, whose stripes must run 1-9), so equivalent puzzles share
+    one canonical form and can share cache entries. Only this subgroup
+    of the sudoku symmetries is used, so not every pair of equivalent
+    sudoku puzzles is identified.
+    """
+
+    best = None
+    for k in range(8):
+        grid = dihedral(puzzle, k)
+        given = grid[grid > 0]
+        # number the digits in order of first appearance
+        digits, first = np.unique(given, return_index=True)
+        order = list(digits[np.argsort(first)]) + [d for d in range(1, 10) if d not in digits]
+        relabel = np.zeros(10, puzzle.dtype)
+        relabel[order] = np.arange(1, 10)
+        candidate = relabel[grid]
+        if best is None or candidate.ravel().tolist() < best[0].ravel().tolist():
+            best = (candidate, (k, relabel))
+    return best
+
+def restore_solution(solution, transform):
+    """
+    ([str], (int, np.array)) -> [int]
+
+    Map a solution of a canonical puzzle back to the puzzle that
+    canonicalize was given, as a list of true cell variables.
+    """
+
+    k, relabel = transform
+    grid = undo_dihedral(np.argsort(relabel)[decode(solution)], k)
+    rows, columns = np.nonzero(grid)
+    return (rows * 81 + columns * 9 + grid[rows, columns]).tolist()
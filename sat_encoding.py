@@ -9,20 +9,105 @@ https://people.mpi-sws.org/~joel/publications/sudoku05.pdf
 At least one cell ^ at most one row ^ at most one column ^ at most one block
 '''
 
+import hashlib
 import itertools
 import math
+import os
 import numpy as np
 import pycosat
 
+# Bump when the clauses produced by encode_sudoku change; cached
+# encodings are also invalidated whenever this file changes.
+ENCODING_VERSION = 1
+# Where load_encoding keeps encoded rule sets
+ENCODING_CACHE = '.encoding_cache'
+
+class ClauseStore(object):
+    ''' A compact list of clauses: one flat int32 array of literals and
+        the offsets at which each clause starts, with offsets[-1] the
+        total number of literals. Iterating yields each clause as a list
+        of ints, so it can stand in for the [[int]] encodings. '''
+
+    def __init__(self, literals, offsets):
+        self.literals = np.asarray(literals, dtype = np.int32)
+        self.offsets = np.asarray(offsets, dtype = np.int64)
+
+    @classmethod
+    def from_fixed(cls, clauses):
+        ''' Store a (n_clauses x width) array of equally long clauses. '''
+        clauses = np.asarray(clauses)
+        n_clauses, width = clauses.shape
+        return cls(clauses.ravel(), np.arange(n_clauses + 1) * width)
+
+    @classmethod
+    def from_lists(cls, clauses):
+        ''' Store a list of clauses given as lists of literals. '''
+        lengths = [len(clause) for clause in clauses]
+        offsets = np.zeros(len(clauses) + 1, dtype = np.int64)
+        np.cumsum(lengths, out = offsets[1:])
+        literals = np.fromiter(itertools.chain.from_iterable(clauses),
+                               dtype = np.int32, count = int(offsets[-1]))
+        return cls(literals, offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __iter__(self):
+        literals = self.literals.tolist()
+        offsets = self.offsets.tolist()
+        for start, end in zip(offsets[:-1], offsets[1:]):
+            yield literals[start:end]
+
+    def __getitem__(self, index):
+        return self.literals[self.offsets[index]:self.offsets[index + 1]].tolist()
+
+    def __add__(self, other):
+        return concatenate_clauses([self, other])
+
+    def __radd__(self, other):
+        return concatenate_clauses([other, self])
+
+    def max_variable(self):
+        ''' Return the highest variable used in any clause. '''
+        if len(self.literals) == 0:
+            return 0
+        return int(np.abs(self.literals).max())
+
+    def to_lists(self):
+        ''' Return the clauses as a list of lists of ints. '''
+        return list(self)
+
+    def dimacs_clauses(self):
+        ''' Render the clauses as DIMACS clause lines, each ending in 0. '''
+        if len(self) == 0:
+            return ''
+        if (np.diff(self.offsets) == 0).any():
+            # empty clauses render as a bare 0
+            return ''.join([' '.join(map(str, clause + [0])) + '\n' for clause in self])
+        # put a 0 after every clause, then break the line after every 0
+        terminated = np.insert(self.literals, self.offsets[1:], 0)
+        return ' '.join(map(str, terminated.tolist())).replace(' 0 ', ' 0\n') + '\n'
+
+
+def concatenate_clauses(encodings):
+    ''' Join clause stores and [[int]] encodings into one ClauseStore. '''
+    stores = [encoding if isinstance(encoding, ClauseStore)
+              else ClauseStore.from_lists(encoding) for encoding in encodings]
+    literals = np.concatenate([store.literals for store in stores])
+    offsets = [np.zeros(1, dtype = np.int64)]
+    total = 0
+    for store in stores:
+        offsets.append(store.offsets[1:] + total)
+        total += store.offsets[-1]
+    return ClauseStore(literals, np.concatenate(offsets))
+
+
 def create_variables(n_rows, n_columns, n_numbers):
     ''' Create (n_rows x n_columns x n_numbers) variables that
         represent the tiles of the sudoku with all possible values. '''
-    variables = np.zeros([n_rows, n_columns, n_numbers], dtype = np.int)
-    for i in range(n_rows):
-        for j in range(n_columns):
-            for k in range(n_numbers):
-                variables[i][j][k] = i*n_columns*n_numbers + j*n_numbers + k +1
-    return variables
+    # variables[i][j][k] = i*n_columns*n_numbers + j*n_numbers + k + 1
+    variables = np.arange(1, n_rows*n_columns*n_numbers + 1, dtype = int)
+    return variables.reshape(n_rows, n_columns, n_numbers)
 
 
 def each_cell(variables):
@@ -260,6 +345,322 @@ def stripe_block(variables, number_extra_variables):
     return enc, extra_variable_start + 3*rows + 1
 
 
+def negated_pairs(first, second):
+    ''' Store the binary clauses [-first, -second] for two equally
+        shaped arrays of variables, in row-major order. '''
+    return ClauseStore.from_fixed(-np.stack([first.ravel(), second.ravel()], axis = 1))
+
+
+def each_cell_store(variables):
+    ''' Vectorized each_cell: each cell must contain a number. '''
+    return ClauseStore.from_fixed(variables.reshape(-1, variables.shape[2]))
+
+
+def each_row_store(variables):
+    ''' Vectorized each_row: each number can only occur once per row. '''
+    # index as [row][number][column]
+    lines = variables.transpose(0, 2, 1)
+    first, second = np.triu_indices(lines.shape[2], 1)
+    return negated_pairs(lines[:, :, first], lines[:, :, second])
+
+
+def each_column_store(variables):
+    ''' Vectorized each_column: each number can only occur once per column. '''
+    # index as [column][number][row]
+    lines = variables.transpose(1, 2, 0)
+    first, second = np.triu_indices(lines.shape[2], 1)
+    return negated_pairs(lines[:, :, first], lines[:, :, second])
+
+
+def blocks_of(variables):
+    ''' Index the variables as [block][cell][number], both in
+        row-major order, or return None if blocks are not square. '''
+    rows, columns, numbers = variables.shape
+    if ((not math.sqrt(columns).is_integer())
+         or (not math.sqrt(rows).is_integer())): return None
+    r_size = int(math.sqrt(rows))
+    c_size = int(math.sqrt(columns))
+    blocks = variables.reshape(r_size, r_size, c_size, c_size, numbers)
+    blocks = blocks.transpose(0, 2, 1, 3, 4)
+    return blocks.reshape(r_size*c_size, r_size*c_size, numbers)
+
+
+def each_block_store(variables):
+    ''' Vectorized each_block: each number can only occur once per block.
+        Like each_block, only pairs cells in different rows of a block. '''
+    blocks = blocks_of(variables)
+    if blocks is None:
+        return ClauseStore.from_lists([])
+    r_size = int(math.sqrt(variables.shape[0]))
+    c_size = int(math.sqrt(variables.shape[1]))
+    # cell pairs (r_block, c_block), (r, c) with r > r_block
+    later_row = np.arange(r_size)[:, None, None, None] < np.arange(r_size)[None, None, :, None]
+    r_block, c_block, r, c = np.nonzero(
+        np.broadcast_to(later_row, (r_size, c_size, r_size, c_size)))
+    first = r_block*c_size + c_block
+    second = r*c_size + c
+    # index as [block][number][cell]
+    blocks = blocks.transpose(0, 2, 1)
+    return negated_pairs(blocks[:, :, first], blocks[:, :, second])
+
+
+def each_diagonal_store(variables):
+    ''' Vectorized each_diagonal: each number can only occur once per diagonal. '''
+    rows, columns, numbers = variables.shape
+    index = np.arange(rows)
+    main = variables[index, index]
+    anti = variables[index, columns - 1 - index]
+    # (index, number, i) with i > index, in loop order
+    later = index[:, None, None] < index[None, None, :]
+    first, number, second = np.nonzero(np.broadcast_to(later, (rows, numbers, rows)))
+    # left top - right bottom and right top - left bottom pairs alternate
+    pairs = np.stack([np.stack([main[first, number], main[second, number]], axis = 1),
+                      np.stack([anti[first, number], anti[second, number]], axis = 1)], axis = 1)
+    return ClauseStore.from_fixed(-pairs.reshape(-1, 2))
+
+
+def stripe_lines_store(asc, dsc, extra_variable_start):
+    ''' Vectorized stripe encoding of a set of lines (rows, columns or
+        blocks), given the variables of each line's ascending and
+        descending stripe. Returns the clauses and the next free variable. '''
+    n_lines, length = asc.shape
+    variable = extra_variable_start + 3*np.arange(n_lines)
+    # each line: [-v, asc[k]] then [-(v + 1), dsc[k]] for k >= 1
+    tails = np.concatenate([
+        np.stack([np.broadcast_to(-variable[:, None], (n_lines, length - 1)), asc[:, 1:]], axis = 2),
+        np.stack([np.broadcast_to(-(variable + 1)[:, None], (n_lines, length - 1)), dsc[:, 1:]], axis = 2)],
+        axis = 1)
+    # one of the lines must be striped
+    new_rule = np.concatenate([[-1 * (extra_variable_start + 3*n_lines)], variable + 2])
+    # take first and replace rest with new variable
+    line_enc = np.stack([
+        np.stack([-(variable + 2), asc[:, 0], variable + 1], axis = 1),
+        np.stack([-(variable + 2), dsc[:, 0], variable], axis = 1)], axis = 1)
+    enc = concatenate_clauses([ClauseStore.from_fixed(tails.reshape(-1, 2)),
+                               ClauseStore.from_fixed(new_rule[None, :]),
+                               ClauseStore.from_fixed(line_enc.reshape(-1, 3))])
+    return enc, extra_variable_start + 3*n_lines + 1
+
+
+def stripe_row_store(variables, number_extra_variables):
+    ''' Vectorized stripe_row. '''
+    rows, columns, numbers = variables.shape
+    index = np.arange(columns)
+    asc = variables[:, index, index]
+    dsc = variables[:, index, columns - 1 - index]
+    return stripe_lines_store(asc, dsc, columns*rows*numbers + number_extra_variables + 1)
+
+
+def stripe_column_store(variables, number_extra_variables):
+    ''' Vectorized stripe_column. '''
+    rows, columns, numbers = variables.shape
+    index = np.arange(rows)
+    asc = variables[index, :, index].T
+    dsc = variables[index, :, rows - 1 - index].T
+    return stripe_lines_store(asc, dsc, columns*rows*numbers + number_extra_variables + 1)
+
+
+def stripe_block_store(variables, number_extra_variables):
+    ''' Vectorized stripe_block. '''
+    rows, columns, numbers = variables.shape
+    blocks = blocks_of(variables)
+    if blocks is None:
+        return ClauseStore.from_lists([]), number_extra_variables
+    index = np.arange(blocks.shape[1])
+    asc = blocks[:, index, index]
+    dsc = blocks[:, index, columns - 1 - index]
+    return stripe_lines_store(asc, dsc, columns*rows*numbers + number_extra_variables + 1)
+
+
+def stripe_options(variables):
+    ''' The ways a stripe can run, one per row of the result: each row,
+        column and block, ascending and descending, as the variables
+        that must all be true for that stripe. '''
+    rows, columns, numbers = variables.shape
+    index = np.arange(columns)
+    options = [variables[:, index, index], variables[:, index, columns - 1 - index],
+               variables[index, :, index].T, variables[index, :, rows - 1 - index].T]
+    blocks = blocks_of(variables)
+    if blocks is not None:
+        index = np.arange(blocks.shape[1])
+        options += [blocks[:, index, index], blocks[:, index, columns - 1 - index]]
+    return np.concatenate(options)
+
+
+def stripe_candidates(puzzles):
+    ''' Return, for an (N, size, size) array of puzzles, an (N, n_options)
+        array saying which stripes of stripe_options each puzzle's
+        givens still allow: those where every given sits in its place
+        in the stripe. '''
+    n_puzzles, size = puzzles.shape[:2]
+    options = stripe_options(create_variables(size, size, size)) - 1
+    cells, numbers = np.divmod(options, size)
+    values = puzzles.reshape(n_puzzles, -1)[:, cells]
+    return ((values == 0) | (values == numbers + 1)).all(axis = 2)
+
+
+def stripe_candidates_store(variables, candidates, extra_variable_start):
+    ''' Encode that one of the candidate stripes (a boolean mask over
+        stripe_options) holds, with a new variable per stripe that
+        implies its cells; stripe k is variable extra_variable_start + k.
+        With no candidates, the encoding is the empty clause. '''
+    options = stripe_options(variables)
+    chosen = np.nonzero(candidates)[0]
+    stripes = extra_variable_start + chosen
+    implied = np.stack([np.broadcast_to(-stripes[:, None], options[chosen].shape), options[chosen]], axis = 2)
+    return concatenate_clauses([ClauseStore.from_lists([stripes.tolist()]),
+                                ClauseStore.from_fixed(implied.reshape(-1, 2))])
+
+
+# At-most-one encodings encode_sudoku can use for rows, columns, blocks
+# and diagonals. pairwise is the minimal encoding above; extended adds
+# the redundant clauses of the extended encoding (Lynce and Ouaknine):
+# each cell holds at most one number, and each number occurs at least
+# once in each row, column, block (and diagonal)
+AMO_ENCODINGS = ('pairwise', 'sequential', 'commander', 'product', 'extended')
+
+
+def binary_clauses(first, second):
+    ''' Store the binary clauses [first, second] for two broadcastable
+        arrays of literals, dropping clauses with a 0 (padding). '''
+    first, second = np.broadcast_arrays(first, second)
+    pairs = np.stack([first.ravel(), second.ravel()], axis = 1)
+    return ClauseStore.from_fixed(pairs[(pairs != 0).all(axis = 1)])
+
+
+def new_variables(next_variable, shape):
+    ''' Number an array of new variables from next_variable. Returns
+        the variables and the next free variable. '''
+    count = int(np.prod(shape))
+    return next_variable + np.arange(count).reshape(shape), next_variable + count
+
+
+def pairwise_amo(groups, next_variable):
+    ''' At most one variable of each row of groups is true: one binary
+        clause per pair, no new variables. 0 entries are padding. '''
+    first, second = np.triu_indices(groups.shape[1], 1)
+    return binary_clauses(-groups[:, first], -groups[:, second]), next_variable
+
+
+def sequential_amo(groups, next_variable):
+    ''' Sequential counter (ladder) encoding (Sinz): m - 1 new variables
+        s and 3m - 4 binary clauses per group, where s[i] means one of
+        the first i + 1 variables is true. '''
+    n_groups, m = groups.shape
+    if m <= 1:
+        return ClauseStore.from_lists([]), next_variable
+    s, next_variable = new_variables(next_variable, (n_groups, m - 1))
+    enc = concatenate_clauses([binary_clauses(-groups[:, :-1], s),
+                               binary_clauses(-s[:, :-1], s[:, 1:]),
+                               binary_clauses(-groups[:, 1:], -s)])
+    return enc, next_variable
+
+
+def commander_amo(groups, next_variable, size = 3):
+    ''' Commander encoding (Klieber and Kwon): split each group into
+        subgroups of size variables, each with a commander variable
+        implied by its members; at most one member of a subgroup and at
+        most one commander is true, recursively. '''
+    n_groups, m = groups.shape
+    if m <= size + 1:
+        return pairwise_amo(groups, next_variable)
+    n_subgroups = -(-m // size)
+    padded = np.zeros((n_groups, n_subgroups * size), groups.dtype)
+    padded[:, :m] = groups
+    subgroups = padded.reshape(n_groups, n_subgroups, size)
+    commanders, next_variable = new_variables(next_variable, (n_groups, n_subgroups))
+    within, _ = pairwise_amo(subgroups.reshape(-1, size), next_variable)
+    implied = binary_clauses(-subgroups, commanders[:, :, None])
+    between, next_variable = commander_amo(commanders, next_variable, size)
+    return concatenate_clauses([within, implied, between]), next_variable
+
+
+def product_amo(groups, next_variable):
+    ''' Product encoding (Chen): lay each group out on a p x q grid with
+        a new variable per grid row and per grid column, each implied by
+        the variables in it; at most one grid row and one grid column
+        variable is true, recursively. '''
+    n_groups, m = groups.shape
+    if m <= 4:
+        return pairwise_amo(groups, next_variable)
+    p = int(math.ceil(math.sqrt(m)))
+    q = -(-m // p)
+    rows, next_variable = new_variables(next_variable, (n_groups, p))
+    columns, next_variable = new_variables(next_variable, (n_groups, q))
+    position = np.arange(m)
+    implied = concatenate_clauses([binary_clauses(-groups, rows[:, position // q]),
+                                   binary_clauses(-groups, columns[:, position % q])])
+    row_enc, next_variable = product_amo(rows, next_variable)
+    column_enc, next_variable = product_amo(columns, next_variable)
+    return concatenate_clauses([implied, row_enc, column_enc]), next_variable
+
+
+def at_most_one(groups, amo, next_variable):
+    ''' Encode that at most one variable of each row of groups is true
+        with the given AMO encoding, numbering new variables from
+        next_variable. Returns the clauses and the next free variable. '''
+    if amo in ('pairwise', 'extended'):
+        return pairwise_amo(groups, next_variable)
+    if amo == 'sequential':
+        return sequential_amo(groups, next_variable)
+    if amo == 'commander':
+        return commander_amo(groups, next_variable)
+    if amo == 'product':
+        return product_amo(groups, next_variable)
+    raise ValueError('unknown at-most-one encoding ' + repr(amo) + '; choose from ' + ', '.join(AMO_ENCODINGS))
+
+
+def constraint_groups(variables, x=False):
+    ''' The groups of variables of which at most one is true: each
+        number in each row, column, block (and diagonal), as rows of
+        2-D arrays. '''
+    rows, columns, numbers = variables.shape
+    groups = [variables.transpose(0, 2, 1).reshape(-1, columns),
+              variables.transpose(1, 2, 0).reshape(-1, rows)]
+    blocks = blocks_of(variables)
+    if blocks is not None:
+        groups += [blocks.transpose(0, 2, 1).reshape(-1, blocks.shape[1])]
+    if (x):
+        groups += diagonal_groups(variables)
+    return groups
+
+
+def diagonal_groups(variables):
+    ''' The groups of variables of each number on the main and the
+        anti diagonal, as in constraint_groups. '''
+    rows, columns, numbers = variables.shape
+    index = np.arange(rows)
+    return [variables[index, index].T, variables[index, columns - 1 - index].T]
+
+
+def extended_clauses(variables, x=False):
+    ''' The redundant clauses of the extended encoding: each cell holds
+        at most one number, and each number occurs at least once in
+        each row, column, block (and diagonal). '''
+    cells, _ = pairwise_amo(variables.reshape(-1, variables.shape[2]), 0)
+    return concatenate_clauses([cells] + [ClauseStore.from_fixed(groups)
+                                          for groups in constraint_groups(variables, x)])
+
+
+def encoding_size(encoding):
+    ''' Return the number of variables, clauses and literals of an encoding. '''
+    if not isinstance(encoding, ClauseStore):
+        encoding = ClauseStore.from_lists(encoding)
+    return encoding.max_variable(), len(encoding), len(encoding.literals)
+
+
+def print_encoding_sizes(sizes = (9, 16, 25), x=False, stripe=False):
+    ''' Print the variables, clauses and literals of each AMO encoding
+        of sudokus of the given sizes. '''
+    print('{:>6}  {:<11}{:>10}{:>11}{:>12}'.format('size', 'amo', 'variables', 'clauses', 'literals'))
+    for size in sizes:
+        for amo in AMO_ENCODINGS:
+            n_variables, n_clauses, n_literals = encoding_size(
+                encode_sudoku(size, size, size, x, stripe, vectorized = True, amo = amo))
+            print('{:>6}  {:<11}{:>10}{:>11}{:>12}'.format(str(size) + 'x' + str(size), amo,
+                                                         n_variables, n_clauses, n_literals))
+
+
 def sat_to_sudoku(sat_sudoku, n_rows, n_columns, n_numbers):
     ''' Pretty print the solution of the sudoku found by the SAT sovler.
         TODO: print the horizontal bar better for 16x16.'''
@@ -284,9 +685,18 @@ def sat_to_sudoku(sat_sudoku, n_rows, n_columns, n_numbers):
             print('{:-^4}'.format((n_numbers + 4)* '---'))
 
 
-def encode_sudoku(n_rows, n_columns, n_numbers, x=False, stripe=False):
-    ''' Encode a (n_rows x n_columns x n_numbers) sudoku. '''
+def encode_sudoku(n_rows, n_columns, n_numbers, x=False, stripe=False, vectorized=False, amo='pairwise',
+                  candidates=None):
+    ''' Encode a (n_rows x n_columns x n_numbers) sudoku. With vectorized,
+        build the same clauses with numpy and return a ClauseStore. amo
+        is one of AMO_ENCODINGS; the others are built with numpy. With
+        stripe and candidates, a mask from stripe_candidates, only the
+        candidate stripes are encoded (see stripe_candidates_store). '''
     variables = create_variables(n_rows, n_columns, n_numbers)
+    if (vectorized):
+        return encode_sudoku_store(variables, x, stripe, amo, candidates)
+    if amo != 'pairwise' or candidates is not None:
+        return encode_sudoku_store(variables, x, stripe, amo, candidates).to_lists()
     encoded = each_cell(variables)
     encoded += each_row(variables)
     encoded += each_column(variables)
@@ -317,6 +727,257 @@ def encode_sudoku(n_rows, n_columns, n_numbers, x=False, stripe=False):
     return encoded
 
 
+def encode_sudoku_store(variables, x=False, stripe=False, amo='pairwise', candidates=None):
+    ''' Vectorized encode_sudoku over the given variables, as the rule
+        set of the 'sudoku', 'x' and 'stripe' constraint modules. New
+        variables of the AMO encoding come right after the cell
+        variables, and those of the stripe encoding after them. '''
+    modules = ['sudoku']
+    if (x):
+        modules += ['x']
+    if (stripe and candidates is None):
+        modules += ['stripe']
+    encoded, next_variable = encode_rule_set(modules, variables, amo)
+    if (stripe and candidates is not None):
+        encoded = concatenate_clauses([encoded, stripe_candidates_store(variables, candidates, next_variable)])
+    return encoded
+
+
+def sudoku_constraint(variables, amo, next_variable):
+    ''' The classic rules: each cell holds a number, and each number
+        occurs at most once per row, column and block. '''
+    encoded = [each_cell_store(variables)]
+    if amo in ('pairwise', 'extended'):
+        encoded += [each_row_store(variables),
+                    each_column_store(variables),
+                    each_block_store(variables)]
+        if amo == 'extended':
+            encoded += [extended_clauses(variables)]
+    else:
+        for groups in constraint_groups(variables):
+            group_encoding, next_variable = at_most_one(groups, amo, next_variable)
+            encoded += [group_encoding]
+    return concatenate_clauses(encoded), next_variable
+
+
+def diagonal_constraint(variables, amo, next_variable):
+    ''' X-sudoku: each number occurs at most once per main diagonal
+        (and, with the extended encoding, at least once). '''
+    if amo in ('pairwise', 'extended'):
+        encoded = [each_diagonal_store(variables)]
+        if amo == 'extended':
+            encoded += [ClauseStore.from_fixed(groups) for groups in diagonal_groups(variables)]
+    else:
+        encoded = []
+        for groups in diagonal_groups(variables):
+            group_encoding, next_variable = at_most_one(groups, amo, next_variable)
+            encoded += [group_encoding]
+    return concatenate_clauses(encoded), next_variable
+
+
+def stripe_constraint(variables, amo, next_variable):
+    ''' Sudoku stripe: some row, column or block holds the numbers in
+        ascending or descending order. The AMO encoding does not apply. '''
+    n_cells = variables.size
+    extra_variables_start = next_variable - n_cells - 1
+    encoded = []
+    one_stripe_true = []
+    for stripe_store in (stripe_row_store, stripe_column_store, stripe_block_store):
+        stripe_encoding, extra_variables_start = stripe_store(variables, extra_variables_start)
+        one_stripe_true += [extra_variables_start - 1]
+        encoded += [stripe_encoding]
+
+    # Either row or colummn or block must be striped
+    encoded += [ClauseStore.from_fixed([one_stripe_true])]
+    encoded = concatenate_clauses(encoded)
+    return encoded, max(next_variable, encoded.max_variable() + 1)
+
+
+# a knight's moves to cells in later rows
+KNIGHT_MOVES = ((1, -2), (1, 2), (2, -1), (2, 1))
+
+
+def anti_knight_constraint(variables, amo, next_variable):
+    ''' Anti-knight: cells a knight's move apart hold different numbers.
+        Each pair is one binary clause per number, whatever the AMO
+        encoding. '''
+    rows, columns, numbers = variables.shape
+    r, c = np.divmod(np.arange(rows*columns), columns)
+    first, second = [], []
+    for dr, dc in KNIGHT_MOVES:
+        inside = (r + dr < rows) & (c + dc >= 0) & (c + dc < columns)
+        first += [variables[r[inside], c[inside]]]
+        second += [variables[r[inside] + dr, c[inside] + dc]]
+    return negated_pairs(np.concatenate(first), np.concatenate(second)), next_variable
+
+
+def windows_of(variables):
+    ''' Index the variables of the windoku windows as [window][cell]
+        [number]: block-sized squares one cell in from the edges and
+        one cell apart (four on a 9x9 grid), or return None if blocks
+        are not square. '''
+    rows, columns, numbers = variables.shape
+    if ((not math.sqrt(columns).is_integer())
+         or (not math.sqrt(rows).is_integer())): return None
+    r_size = int(math.sqrt(rows))
+    c_size = int(math.sqrt(columns))
+    windows = [variables[r:r + r_size, c:c + c_size].reshape(-1, numbers)
+               for r in range(1, rows - r_size + 1, r_size + 1)
+               for c in range(1, columns - c_size + 1, c_size + 1)]
+    return np.array(windows)
+
+
+def windoku_constraint(variables, amo, next_variable):
+    ''' Windoku: each number occurs at most once per window (and, with
+        the extended encoding, at least once). '''
+    windows = windows_of(variables)
+    if windows is None:
+        return ClauseStore.from_lists([]), next_variable
+    # index as [window][number][cell]
+    groups = windows.transpose(0, 2, 1).reshape(-1, windows.shape[1])
+    encoded, next_variable = at_most_one(groups, amo, next_variable)
+    if amo == 'extended':
+        encoded = concatenate_clauses([encoded, ClauseStore.from_fixed(groups)])
+    return encoded, next_variable
+
+
+def non_consecutive_constraint(variables, amo, next_variable):
+    ''' Non-consecutive: orthogonally adjacent cells do not hold
+        consecutive numbers. '''
+    encoded = []
+    for first, second in ((variables[:, :-1], variables[:, 1:]),
+                          (variables[:-1], variables[1:])):
+        encoded += [negated_pairs(first[..., :-1], second[..., 1:]),
+                    negated_pairs(first[..., 1:], second[..., :-1])]
+    return concatenate_clauses(encoded), next_variable
+
+
+# The constraint modules rule sets are combined from, by name. Each is
+# a function of the cell variables, the AMO encoding and the next free
+# variable, returning its clauses and the next free variable.
+CONSTRAINTS = {}
+
+
+def register_constraint(name, encoder):
+    ''' Make a constraint module available to rule sets under name. '''
+    CONSTRAINTS[name] = encoder
+
+
+register_constraint('sudoku', sudoku_constraint)
+register_constraint('x', diagonal_constraint)
+register_constraint('stripe', stripe_constraint)
+register_constraint('anti-knight', anti_knight_constraint)
+register_constraint('windoku', windoku_constraint)
+register_constraint('non-consecutive', non_consecutive_constraint)
+
+# Clause blocks of the constraint modules encoded in this process,
+# shared between the rule sets using them
+_blocks = {}
+
+
+def constraint_block(name, variables, amo='pairwise', next_variable=None):
+    ''' Return the clauses of one constraint module over the variables
+        of create_variables and the next free variable, numbering its
+        new variables from next_variable (by default right after the
+        cell variables). Each block is encoded once per process. '''
+    if name not in CONSTRAINTS:
+        raise ValueError('unknown constraint ' + repr(name) + '; choose from ' + ', '.join(CONSTRAINTS))
+    if next_variable is None:
+        next_variable = variables.size + 1
+    key = (name, variables.shape, amo, next_variable)
+    if key not in _blocks:
+        _blocks[key] = CONSTRAINTS[name](variables, amo, next_variable)
+    return _blocks[key]
+
+
+def encode_rule_set(modules, variables, amo='pairwise'):
+    ''' Encode the rule set of the given constraint modules, in order,
+        from their shared blocks. Returns the clauses and the next free
+        variable. '''
+    encoded = []
+    next_variable = variables.size + 1
+    for name in modules:
+        block, next_variable = constraint_block(name, variables, amo, next_variable)
+        encoded += [block]
+    return concatenate_clauses(encoded), next_variable
+
+
+def variant_modules(variant):
+    ''' The constraint modules of a variant, named by its modules other
+        than 'sudoku' joined with '+' (e.g. 'x+windoku'); the sudoku
+        rules come first. '''
+    modules = ['sudoku'] + [name for name in variant.split('+') if name != 'sudoku']
+    for name in modules:
+        if name not in CONSTRAINTS:
+            raise ValueError('unknown constraint ' + repr(name) + ' in variant ' + repr(variant)
+                             + '; choose from ' + ', '.join(CONSTRAINTS))
+    return modules
+
+
+def rule_set_name(modules, n_rows=9, n_columns=9, n_numbers=9):
+    ''' Name a rule set by its grid and its modules besides 'sudoku',
+        e.g. 9x9x9-x. '''
+    return (str(n_rows) + 'x' + str(n_columns) + 'x' + str(n_numbers)
+            + ''.join('-' + name for name in modules if name != 'sudoku'))
+
+
+def encoder_fingerprint():
+    ''' Identify the current encoder: its version and a hash of this file. '''
+    with open(os.path.abspath(__file__), 'rb') as source:
+        digest = hashlib.sha1(source.read()).hexdigest()[:12]
+    return 'v' + str(ENCODING_VERSION) + '-' + digest
+
+
+def load_encoding(n_rows, n_columns, n_numbers, x=False, stripe=False, cache_dir=ENCODING_CACHE,
+                  amo='pairwise'):
+    ''' Return encode_sudoku(..., vectorized=True) from the on-disk cache,
+        encoding and saving it on a miss (see load_rule_set). '''
+    modules = ['sudoku']
+    if (x):
+        modules += ['x']
+    if (stripe):
+        modules += ['stripe']
+    return load_rule_set(modules, n_rows, n_columns, n_numbers, cache_dir, amo)
+
+
+def load_rule_set(modules, n_rows=9, n_columns=9, n_numbers=9, cache_dir=ENCODING_CACHE,
+                  amo='pairwise'):
+    ''' Return the rule set of the given constraint modules from the
+        on-disk cache, encoding and saving it on a miss. Cached clauses
+        are memory-mapped rather than read; entries from older encoders
+        are removed. '''
+    name = rule_set_name(modules, n_rows, n_columns, n_numbers)
+    if amo != 'pairwise':
+        name += '-' + amo
+    key = name + '-' + encoder_fingerprint()
+    literals_path = os.path.join(cache_dir, key + '.literals.npy')
+    offsets_path = os.path.join(cache_dir, key + '.offsets.npy')
+
+    if not (os.path.exists(literals_path) and os.path.exists(offsets_path)):
+        os.makedirs(cache_dir, exist_ok = True)
+        # drop stale encodings of the same rule set, leaving the current
+        # encoder's files and other processes' partial writes alone
+        for entry in os.listdir(cache_dir):
+            if (entry.startswith(name + '-v') and not entry.startswith(key + '.')
+                    and not entry.endswith('.tmp')):
+                try:
+                    os.remove(os.path.join(cache_dir, entry))
+                except FileNotFoundError:
+                    # another process got there first
+                    pass
+        variables = create_variables(n_rows, n_columns, n_numbers)
+        encoding, _ = encode_rule_set(modules, variables, amo)
+        # write under a temporary name first so readers never see half a file
+        for path, array in ((offsets_path, encoding.offsets), (literals_path, encoding.literals)):
+            partial = path + '.' + str(os.getpid()) + '.tmp'
+            with open(partial, 'wb') as out:
+                np.save(out, array)
+            os.replace(partial, path)
+
+    return ClauseStore(np.load(literals_path, mmap_mode = 'r'),
+                       np.load(offsets_path, mmap_mode = 'r'))
+
+
 def to_DIMACS(encoding, name, number_variables):
     ''' Convert the encoding to the DIMACS format.
         c [filename]
@@ -329,11 +990,10 @@ def to_DIMACS(encoding, name, number_variables):
     number_clauses = len(encoding)
     DIMACS_encoding += "p cnf " + str(number_variables) + " " + \
                         str(number_clauses) + "\n"
-    for clause in encoding:
-        for literal in clause:
-            DIMACS_encoding += (str(literal) + " ")
-        DIMACS_encoding += "0\n"
-    return DIMACS_encoding
+    if isinstance(encoding, ClauseStore):
+        return DIMACS_encoding + encoding.dimacs_clauses()
+    return DIMACS_encoding + "".join(["".join([str(literal) + " " for literal in clause]) + "0\n"
+                                      for clause in encoding])
 
 
 def main():
@@ -349,10 +1009,13 @@ def main():
     sat_to_sudoku(sat_sudoku9, 9, 9, 9)
 
     # 16x16 sudoku example
-    encode_sudoku16 = encode_sudoku(16, 16, 16)
+    encode_sudoku16 = load_encoding(16, 16, 16)
     sat_sudoku16 = pycosat.solve(encode_sudoku16)
     sat_to_sudoku(sat_sudoku16, 16, 16, 16)
 
+    # size of each at-most-one encoding
+    print_encoding_sizes()
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,100 @@
+# Hunter McKnight
+# KRCourse 2017
+
+import csv
+import numpy as np
+from sat_encoding import stripe_candidates
+
+def feasible_stripes(puzzles):
+    """
+    (np.array) -> np.array
+
+    Return, for each puzzle of an (N, size, size) array, the number
+    of stripes (lines and directions) its givens still allow; see
+    sat_encoding.stripe_candidates.
+    """
+
+    return stripe_candidates(puzzles).sum(axis=1)
+
+def diagonals_consistent(puzzles):
+    """
+    (np.array) -> np.array
+
+    Return, for each puzzle, whether no digit is given twice on
+    either main diagonal (otherwise it is no x-sudoku at all).
+    """
+
+    size = puzzles.shape[1]
+    index = np.arange(size)
+    consistent = np.ones(len(puzzles), bool)
+    for diagonal in (puzzles[:, index, index], puzzles[:, index, size - 1 - index]):
+        counts = np.zeros((len(puzzles), size + 1), np.int32)
+        np.add.at(counts, (np.arange(len(puzzles))[:, None], diagonal), 1)
+        consistent &= (counts[:, 1:] <= 1).all(axis=1)
+    return consistent
+
+def estimate_costs(puzzles):
+    """
+    (np.array) -> np.array
+
+    Estimate the relative cost of solving each puzzle as x-sudoku and
+    as sudoku stripe from its givens alone. Only the ranking matters:
+    a puzzle costs more the more cells it leaves blank, an x-sudoku
+    whose diagonals already repeat a digit costs nothing, and a
+    sudoku stripe costs more the more lines a stripe may still take.
+    """
+
+    blanks = (puzzles.reshape((len(puzzles), -1)) == 0).sum(axis=1)
+    return blanks * (diagonals_consistent(puzzles) + feasible_stripes(puzzles))
+
+def load_costs(path, first=0):
+    """
+    (str, int) -> np.array
+
+    Read the cost of each puzzle in an earlier run from its
+    metrics.csv (decisions plus conflicts of both rule sets) or its
+    timings file (total seconds of both rule sets). Return an array
+    indexed by puzzle, with NaN for puzzles the file does not cover.
+
+    Metrics rows carry no puzzle index, so row k is taken to be
+    puzzle first + k; pass the first puzzle of the shard for a
+    shard's metrics file. Timings rows name their puzzle.
+    """
+
+    with open(path, newline='') as costs_file:
+        rows = csv.reader(costs_file)
+        header = next(rows, [])
+        if 'x_total' in header:
+            columns = [header.index('x_total'), header.index('stripe_total')]
+            indexed = [(int(row[0]), sum(float(row[c]) for c in columns)) for row in rows if len(row) == len(header)]
+        elif 'x_num_decisions' in header:
+            columns = [header.index(name) for name in ('x_num_decisions', 'x_conflicts',
+                                                       'stripe_num_decisions', 'stripe_conflicts')]
+            indexed = [(first + i, sum(float(row[c]) for c in columns)) for i, row in enumerate(rows)
+                       if len(row) == len(header)]
+        else:
+            raise ValueError(path + ' is neither a metrics.csv nor a timings file')
+
+    costs = np.full(max([i for i, _ in indexed], default=-1) + 1, np.nan)
+    for i, cost in indexed:
+        costs[i] = cost
+    return costs
+
+def hardest_first(puzzles, first=0, known=None):
+    """
+    (np.array, int, np.array) -> np.array
+
+    Return the order in which to solve a batch of puzzles, whose
+    first puzzle has index first: by the known costs of an earlier
+    run (see load_costs), if any, most expensive first, with
+    puzzles of unknown cost ahead of all others; ties are broken by
+    estimate_costs.
+    """
+
+    estimated = estimate_costs(puzzles)
+    costs = np.full(len(puzzles), np.inf)
+    if known is not None:
+        covered = known[first:first + len(puzzles)]
+        costs[:len(covered)] = np.where(np.isnan(covered), np.inf, covered)
+    # lexsort sorts by its last key first; stable, so ties keep index order
+    return np.lexsort((-estimated, -costs))
@@ -1,51 +1,556 @@
 # Hunter McKnight
 # KRCourse 2017
 
+import hashlib
+import os
+import queue
+import shutil
+import signal
 import subprocess
+import threading
+import time
+import numpy as np
+import pycosat
+import cdcl
+from cdcl import CDCLSolver
+from sat_encoding import ClauseStore, create_variables, encode_sudoku, stripe_options
+from timing import add_time, timed_lines
 
-def solve(clauses, satsolver='zchaff'):
+try:
+    import pysat
+    from pysat.solvers import Solver
+except ImportError:
+    # the incremental backend is optional
+    Solver = None
+
+# if necessary, change these path names to point
+# to zchaff or cadical on your machine
+SOLVER_PATHS = {'zchaff': '/usr/local/zchaff64/zchaff',
+                'cadical': './cadical-master/build/cadical',
+                'minisat': 'minisat',
+                'glucose': 'glucose',
+                'kissat': 'kissat'}
+
+def cached_for(cache, rules, build, *key):
     """
-    ([[int]]) -> [str]
+    (dict, [[int]], function, ...) -> object
 
-    Given a cnf formatted as a numpy array, submit the cnf
-    to a SAT solver (zchaff or cadical) and return the sovler's output
-    as a list of strings.
+    Return what build(rules) made for this rule set (and the rest of
+    key) in this process's cache, building it on first use. Rule sets
+    are keyed by id, which is cheap for a large ClauseStore; the cache
+    keeps a reference to each rule set, so no other object can reuse
+    its id while the entry exists.
+    """
 
-    Modified from David Musicant's original script
-    https://github.com/FatTony746/clueReasoner/blob/master/SATSolver.py
+    key = (id(rules),) + key
+    if key not in cache:
+        cache[key] = (rules, build(rules))
+    return cache[key][1]
+
+# rendered rule sections of the current process, keyed by rule set
+_rendered = {}
+
+def dimacs_clauses(clauses):
+    """
+    ([[int]]) -> str
+
+    Render clauses as DIMACS clause lines, each ending in 0.
     """
-    # create a cnf file to pass to zchaff
+
+    if isinstance(clauses, ClauseStore):
+        return clauses.dimacs_clauses()
+    return ''.join([''.join([str(literal) + ' ' for literal in clause]) + '0\n' for clause in clauses])
+
+def max_variable(clauses):
+    """
+    ([[int]]) -> int
+
+    Return the highest variable used in any clause.
+    """
+
+    if isinstance(clauses, ClauseStore):
+        return clauses.max_variable()
     maxVar = 0
     for clause in clauses:
         for literal in clause:
-            maxVar = max(abs(literal),maxVar)
-    out = open('query.cnf','w')
-    print('c This DIMACS format CNF file was generated by solver.py', file = out)
-    print('c Do not edit.', file = out)
-    print('p cnf',maxVar,len(clauses), file = out)
-    for clause in clauses:
-        for literal in clause:
-            print(literal, end = ' ', file = out)
-        print('0', file = out)
-    out.close();
+            maxVar = max(abs(int(literal)),maxVar)
+    return maxVar
+
+def render_rules(rules):
+    """
+    ([[int]]) -> (str, int, int)
+
+    Return the DIMACS clause lines, highest variable and number of
+    clauses of a rule set. Each rule set is rendered only once per
+    process.
+    """
+
+    return cached_for(_rendered, rules, lambda rules: (dimacs_clauses(rules), max_variable(rules), len(rules)))
+
+def to_dimacs(clauses, rules=None):
+    """
+    ([[int]], [[int]]) -> str
 
-    if(satsolver == 'cadical'):
-        # pass the cnf to cadical
-        process = subprocess.Popen('./cadical-master/build/cadical query.cnf',stdout=subprocess.PIPE, shell=True, universal_newlines=True)
+    Render a cnf as a DIMACS file. If rules are given, the cnf is
+    rules + clauses and the rule section comes from render_rules.
+    """
+
+    if rules is None:
+        rule_lines, rule_max, n_rules = '', 0, 0
     else:
-        # pass the cnf file to zchaff
-        process = subprocess.Popen('/usr/local/zchaff64/zchaff query.cnf',stdout=subprocess.PIPE, shell=True, universal_newlines=True)
+        rule_lines, rule_max, n_rules = render_rules(rules)
+
+    return ('c This DIMACS format CNF file was generated by solver.py\n'
+            'c Do not edit.\n'
+            'p cnf ' + str(max(rule_max, max_variable(clauses))) + ' ' + str(n_rules + len(clauses)) + '\n'
+            + rule_lines + dimacs_clauses(clauses))
+
+def output_words(lines):
+    """
+    (iterable of str) -> iterator of str
+
+    Split solver output into words as it is read.
+    """
+
+    for line in lines:
+        for word in line.split():
+            yield word
+
+def read_statistic(word, words, stats, names):
+    """
+    (str, iterator of str, {str: int}, (str)) -> None
+
+    If word labels one of the named statistics not yet read, as in
+    'decisions: 12' or 'decisions : 12', read its value into stats.
+    """
+
+    name = word.rstrip(':')
+    if name not in names or name in stats:
+        return
+    value = next(words)
+    if value == ':' and not word.endswith(':'):
+        value = next(words)
+    elif not word.endswith(':'):
+        # the word was not a label
+        return
+    try:
+        stats[name] = int(value)
+    except ValueError:
+        pass
+
+def parse_zchaff(lines):
+    """
+    (iterable of str) -> ((bool, int, int, int), [str])
+
+    Read zchaff output in one pass and return the instance
+    satisfiability, Max Decision Level, Num. of Decisions and Added
+    Conflict Clauses, and the satisfying variable assignments.
+    """
+
+    sat = None
+    stats = {}
+    model = []
+    words = output_words(lines)
+    try:
+        for word in words:
+            if word == 'Satisfiable' and not model:
+                # the model runs up to 'Random Seed Used'
+                for var in words:
+                    if var == 'Random':
+                        break
+                    model.append(var)
+            elif word in ('Level', 'Decisions') and word not in stats:
+                stats[word] = int(next(words))
+            elif word == 'Conflict' and word not in stats:
+                # we have one more string to get out of the way, 'Clauses'
+                next(words)
+                stats[word] = int(next(words))
+            elif word == 'RESULT:':
+                answer = next(words)
+                if answer == 'SAT':
+                    sat = True
+                elif answer == 'UNSAT':
+                    sat = False
+                else:
+                    print("Error: SAT/UNSAT not indicated.")
+    except StopIteration:
+        pass
+
+    return (sat, stats.get('Level', 0), stats.get('Decisions', 0), stats.get('Conflict', 0)), model
+
+def competition_parser(conflicts = 'conflicts'):
+    """
+    (str) -> function
+
+    Return a parser for output in the SAT competition format used by
+    cadical, kissat and glucose: a line starting with 's ' with the
+    verdict, lines starting with 'v ' with the model up to 0, and
+    comment lines starting with 'c ' with statistics, which are only
+    searched for statistics (glucose's comments, for one, contain a
+    lone 's' for seconds). The number of added conflict clauses is
+    read from the statistic named conflicts. These solvers do not
+    report max level, so it is 0.
+    """
+
+    def parse(lines):
+        sat = None
+        stats = {}
+        model = []
+        model_read = False
+        for line in lines:
+            # the tag is the first character, followed by a space
+            tag = line[:2]
+            words = iter(line[2:].split())
+            if tag == 's ' and sat is None:
+                answer = next(words, None)
+                if answer == 'SATISFIABLE':
+                    sat = True
+                elif answer == 'UNSATISFIABLE':
+                    sat = False
+                else:
+                    sat = False
+                    print("Error: SAT/UNSAT not indicated.")
+            elif tag == 'v ' and not model_read:
+                for var in words:
+                    if var == '0':
+                        model_read = True
+                        break
+                    model.append(var)
+            elif tag == 'c ':
+                try:
+                    for word in words:
+                        read_statistic(word, words, stats, ('decisions', conflicts))
+                except StopIteration:
+                    pass
+
+        return (sat, 0, stats.get('decisions', 0), stats.get(conflicts, 0)), model
+
+    return parse
+
+def parse_minisat(lines):
+    """
+    (iterable of str) -> ((bool, int, int, int), [str])
+
+    Read minisat output in one pass. Statistics and the verdict go to
+    stdout; the model is in the result file, which the minisat
+    backend also sends to stdout as 'SAT' and a line ending in 0.
+    MiniSat does not report max level, so it is 0.
+    """
+
+    sat = None
+    stats = {}
+    model = []
+    words = output_words(lines)
+    try:
+        for word in words:
+            if word in ('SATISFIABLE', 'UNSATISFIABLE', 'INDETERMINATE') and sat is None:
+                sat = word == 'SATISFIABLE'
+            elif word == 'SAT' and not model:
+                for var in words:
+                    if var == '0':
+                        break
+                    model.append(var)
+            else:
+                read_statistic(word, words, stats, ('decisions', 'conflicts'))
+    except StopIteration:
+        pass
 
+    return (sat, 0, stats.get('decisions', 0), stats.get('conflicts', 0)), model
 
-    # if necessary, change the preceding path name to point
-    # to zchaff or cadical on your machine
+def checked(result):
+    """
+    (((bool, int, int, int), [str])) -> ((bool, int, int, int), [str])
+
+    Report a parsed result with no verdict, or a satisfiable one
+    with no model, as output cut short, and treat it as unsatisfiable.
+    """
+
+    metrics, model = result
+    if metrics[0] is None or (metrics[0] and not model):
+        print("Error: Unexpected file end.")
+    if metrics[0] is None:
+        metrics = (False,) + metrics[1:]
+    return metrics, model
+
+class Backend(object):
+    """
+    An external SAT solver: the command lines that run it on a cnf
+    file, or on a cnf piped to its stdin, and a parser that reads its
+    output line by line and returns the metrics and model in one pass.
+    The parser leaves satisfiability None if the output ends before
+    the verdict.
+
+    Arguments may contain {cnf}, replaced with the cnf path. Solvers
+    that cannot read stdin have no stdin_arguments.
+    """
+
+    def __init__(self, name, parse, arguments=('{cnf}',), stdin_arguments=None):
+        self.name = name
+        self.parse = parse
+        self.arguments = arguments
+        self.stdin_arguments = stdin_arguments
+
+    def command(self, cnf_path=None):
+        """
+        (str) -> [str]
+
+        Return the command line that solves the cnf at cnf_path, or
+        the cnf on stdin if cnf_path is None.
+        """
+
+        if cnf_path is None:
+            return [SOLVER_PATHS[self.name]] + list(self.stdin_arguments)
+        return [SOLVER_PATHS[self.name]] + [argument.format(cnf=cnf_path) for argument in self.arguments]
+
+# external solvers, keyed by name
+BACKENDS = {}
+
+def register_backend(backend):
+    """
+    (Backend) -> None
+
+    Make an external solver available to solve by its name. Its
+    binary is looked up in SOLVER_PATHS.
+    """
+
+    BACKENDS[backend.name] = backend
+
+register_backend(Backend('zchaff', parse_zchaff))
+register_backend(Backend('cadical', competition_parser('learned'), stdin_arguments=()))
+# minisat writes the model to a result file, here stdout
+register_backend(Backend('minisat', parse_minisat, ('{cnf}', '/dev/stdout')))
+register_backend(Backend('glucose', competition_parser(), ('-model', '{cnf}')))
+register_backend(Backend('kissat', competition_parser(), stdin_arguments=()))
+
+def run_solver(clauses, satsolver='zchaff', cnf_path='query.cnf', rules=None, pipe=False, timings=None):
+    """
+    ([[int]], str, str, [[int]], bool, dict) -> ((bool, int, int, int), [str])
+
+    Submit the cnf to an external solver and return the metrics, as
+    get_metrics does, and the model, as get_solution does. The
+    solver's output is parsed line by line as it arrives and never
+    held in memory whole.
+
+    The cnf is written to cnf_path, so concurrent callers must each
+    pass a path of their own; a path on a tmpfs such as /dev/shm keeps
+    it off the disk. With pipe, solvers that can read the cnf from
+    their stdin do so instead and no file is written; the others
+    ignore pipe.
+
+    If rules are given, the cnf is rules + clauses, and the rules are
+    rendered once and reused on later calls.
+
+    If a timings dict is given, the seconds spent rendering and
+    writing the cnf, starting the solver, waiting for it and parsing
+    its output are added to it (see timing.py).
+    """
+
+    backend = BACKENDS[satsolver]
+    start = time.perf_counter()
+    cnf = to_dimacs(clauses, rules)
+    pipe = pipe and backend.stdin_arguments is not None
+    start = add_time(timings, 'render', start)
+
+    if not pipe:
+        with open(cnf_path, 'w') as out:
+            out.write(cnf)
+        start = add_time(timings, 'write', start)
+    process = start_solver(backend, cnf_path, pipe)
+    start = add_time(timings, 'spawn', start)
+    if pipe:
+        # feed the cnf from a thread, so a solver that writes before it
+        # has read all of its input cannot block on a full stdout pipe;
+        # writing then overlaps with, and is counted as, solving
+        feeder = threading.Thread(target=feed_solver, args=(process, cnf), daemon=True)
+        feeder.start()
+
+    with process.stdout:
+        if timings is None:
+            result = backend.parse(process.stdout)
+        else:
+            # time spent waiting for output is solving, the rest parsing
+            waited = timings.get('solve', 0.0)
+            result = backend.parse(timed_lines(process.stdout, timings))
+            add_time(timings, 'parse', start)
+            timings['parse'] -= timings['solve'] - waited
+            start = time.perf_counter()
     process.wait()
-    stdout = process.stdout
-    result = stdout.read().split()
-    stdout.close()
+    if pipe:
+        feeder.join()
+    add_time(timings, 'solve', start)
+
+    return checked(result)
+
+def start_solver(backend, cnf_path='query.cnf', pipe=False):
+    """
+    (Backend, str, bool) -> subprocess.Popen
+
+    Start a solver on the cnf file at cnf_path, or, with pipe, on
+    its stdin, with its output readable line by line.
+    """
+
+    # each solver leads its own process group, so stop_solver also
+    # stops any processes it starts
+    if pipe:
+        return subprocess.Popen(backend.command(), stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE, universal_newlines=True, start_new_session=True)
+    return subprocess.Popen(backend.command(cnf_path), stdout=subprocess.PIPE, universal_newlines=True,
+                            start_new_session=True)
+
+def stop_solver(process):
+    """
+    (subprocess.Popen) -> None
+
+    Kill a solver, if it is still running, and wait for it.
+    """
+
+    if process.poll() is None:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    process.wait()
+
+def feed_solver(process, cnf):
+    """
+    (subprocess.Popen, str) -> None
+
+    Write a cnf to the stdin of a solver started with pipe. Run it
+    in a thread of its own while the solver's output is read.
+    """
+
+    try:
+        process.stdin.write(cnf)
+        process.stdin.close()
+    except (BrokenPipeError, ValueError):
+        # the solver died or was stopped; its output will say so
+        pass
+
+def race(backend, process, results):
+    """
+    (Backend, subprocess.Popen, queue.Queue) -> None
+
+    Parse one portfolio solver's output and report it on results,
+    together with its name and exit status.
+    """
+
+    with process.stdout:
+        result = backend.parse(process.stdout)
+    results.put((backend.name, process.wait(), result))
+
+def run_portfolio(clauses, satsolvers=('zchaff', 'cadical'), cnf_path='query.cnf', rules=None, pipe=False,
+                  timeout=None, timings=None):
+    """
+    ([[int]], [str], str, [[int]], bool, float, dict) -> ((bool, int, int, int), [str], str)
+
+    Start every solver in satsolvers on the same cnf at once, take
+    the first verdict and kill the rest. Return its metrics and model
+    as run_solver does and the name of the solver that gave it.
+
+    If timeout seconds pass with no verdict, or no solver gives one,
+    every solver is killed and the name is None; the metrics then say
+    unsatisfiable with no decisions or conflicts.
+
+    With pipe, solvers that can read the cnf from their stdin do so;
+    the cnf file is written only if some solver needs it.
+
+    Timings are recorded as by run_solver, except that the solvers
+    are parsed while they run, so parsing counts as solving.
+    """
+
+    backends = [BACKENDS[satsolver] for satsolver in satsolvers]
+    start = time.perf_counter()
+    cnf = to_dimacs(clauses, rules)
+    start = add_time(timings, 'render', start)
+
+    if not pipe or any(backend.stdin_arguments is None for backend in backends):
+        with open(cnf_path, 'w') as out:
+            out.write(cnf)
+        start = add_time(timings, 'write', start)
+
+    results = queue.Queue()
+    processes = []
+    winner = None
+    try:
+        for backend in backends:
+            piped = pipe and backend.stdin_arguments is not None
+            process = start_solver(backend, cnf_path, piped)
+            processes.append(process)
+            threading.Thread(target=race, args=(backend, process, results), daemon=True).start()
+            if piped:
+                # a slow reader must not hold up the others
+                threading.Thread(target=feed_solver, args=(process, cnf), daemon=True).start()
+        start = add_time(timings, 'spawn', start)
+
+        deadline = None if timeout is None else time.time() + timeout
+        for _ in backends:
+            try:
+                name, status, (metrics, model) = results.get(
+                    timeout=None if deadline is None else max(deadline - time.time(), 0))
+            except queue.Empty:
+                break
+            # a solver that crashed or ended without a verdict does not win
+            if status >= 0 and metrics[0] is not None and (model or not metrics[0]):
+                winner = name
+                break
+    finally:
+        for process in processes:
+            stop_solver(process)
+        add_time(timings, 'solve', start)
+
+    if winner is None:
+        return (False, 0, 0, 0), [], None
+    return metrics, model, winner
+
+def solve(clauses, satsolver='zchaff', cnf_path='query.cnf', rules=None, pipe=False):
+    """
+    ([[int]]) -> [str]
+
+    Given a cnf formatted as a numpy array, submit the cnf
+    to a SAT solver (any of BACKENDS) and return the sovler's output
+    as a list of strings. See run_solver for the arguments; it parses
+    the output as it arrives instead.
+
+    Modified from David Musicant's original script
+    https://github.com/FatTony746/clueReasoner/blob/master/SATSolver.py
+    """
+    backend = BACKENDS[satsolver]
+    cnf = to_dimacs(clauses, rules)
+    pipe = pipe and backend.stdin_arguments is not None
+
+    if not pipe:
+        # create a cnf file to pass to the solver
+        with open(cnf_path, 'w') as out:
+            out.write(cnf)
+
+    process = subprocess.Popen(backend.command(None if pipe else cnf_path),
+                               stdin=subprocess.PIPE if pipe else None,
+                               stdout=subprocess.PIPE, universal_newlines=True)
+    stdout, _ = process.communicate(cnf if pipe else None)
+    result = stdout.split()
 
     return result
 
+def solver_version(satsolver='zchaff'):
+    """
+    (str) -> str
+
+    Return a string that changes whenever the given solver does:
+    the name and version of the in-process backends, or a hash of
+    the solver binary.
+    """
+
+    if satsolver == 'cdcl':
+        path = cdcl.__file__
+    elif satsolver in ('incremental', 'lazy'):
+        return satsolver + '-pysat-' + (pysat.__version__ if Solver is not None else 'missing')
+    elif satsolver == 'pycosat':
+        return 'pycosat-' + pycosat.__version__
+    else:
+        path = shutil.which(SOLVER_PATHS[satsolver]) or SOLVER_PATHS[satsolver]
+    with open(path, 'rb') as binary:
+        return satsolver + '-' + hashlib.sha1(binary.read()).hexdigest()[:12]
+
 def get_metrics(result, satsolver = 'zchaff'):
     """
     ([str]) -> (bool, int, int, int)
@@ -54,94 +559,354 @@ def get_metrics(result, satsolver = 'zchaff'):
     Max Decision Level, Num. of Decisions, and Added Conflict Clauses.
     """
 
-    sat = False
-    level = 0
-    decisions = 0
-    conflicts = 0
+    return checked(BACKENDS[satsolver].parse(result))[0]
+
+def get_solution(result, satsolver = 'zchaff'):
+    """
+    ([str]) -> [str]
+
+    Read solver output for a satisfiable instance and
+    return a list of satisfying variable assignments.
+    """
+
+    return checked(BACKENDS[satsolver].parse(result))[1]
 
-    words = iter(result)
 
-    if(satsolver == 'cadical'):
+class IncrementalSolver(object):
+    """
+    A long-lived solver that holds one rule set. Each puzzle's givens
+    are passed as assumptions, so the rules are loaded and parsed only
+    once and the solver's learned clauses carry over between puzzles.
+
+    Needs the python-sat package; name is any solver it provides.
+    """
+
+    def __init__(self, rules, name='cadical153'):
+        if Solver is None:
+            raise ImportError('the incremental backend needs python-sat (pip install python-sat)')
+        self.name = name
+        self.solver = Solver(name=name)
+        for clause in rules:
+            self.solver.add_clause([int(literal) for literal in clause])
+        self.decisions = 0
+        self.conflicts = 0
+
+    def solve(self, givens, timeout=None):
+        """
+        ([[int]], float) -> (bool, int, int, int)
+
+        Solve the rules under the given unit clauses and return the
+        instance satisfiability, Max Decision Level, Num. of Decisions,
+        and Added Conflict Clauses for this call alone. Like cadical,
+        the solver does not report max level, so it is always 0.
+        If timeout seconds pass first, the solver is interrupted and
+        satisfiability is None.
+        """
+
+        sat = self.run(assumptions_of(givens), timeout)
+        return (sat,) + self.counters()
+
+    def run(self, assumptions, timeout=None):
+        """
+        ([int], float) -> bool
+
+        Solve under the assumed literals and return whether they are
+        satisfiable, or None if timeout seconds pass first.
+        """
+
+        if timeout is None:
+            return self.solver.solve(assumptions=assumptions)
         try:
-            while next(words) != 's':
-                pass
-            answer = str(next(words))
-            if answer == 'SATISFIABLE':
-                sat = True
-            elif answer == 'UNSATISFIABLE':
-                sat = False
-            else:
-                print("Error: SAT/UNSAT not indicated.")
-            while next(words) != 'decisions:':
-                pass
-            decisions = int(next(words))
-            while next(words) != 'learned:':
-                pass
-            conflicts = int(next(words))
-            # Note: cadical does not report max level
-
-        except StopIteration:
-                print("Error: Unexpected file end.")
-    else:
+            self.solver.clear_interrupt()
+        except NotImplementedError:
+            raise ValueError(self.name + ' cannot be interrupted, so it has no timeout')
+        timer = threading.Timer(timeout, self.solver.interrupt)
+        timer.start()
+        sat = self.solver.solve_limited(assumptions=assumptions, expect_interrupt=True)
+        timer.cancel()
+        self.solver.clear_interrupt()
+        return sat
+
+    def counters(self):
+        """
+        (None) -> (int, int, int)
+
+        Return the max level (always 0), decisions and conflicts
+        since the last call.
+        """
+
+        # the solver's counters accumulate over all calls
+        stats = self.solver.accum_stats()
+        decisions = stats['decisions'] - self.decisions
+        conflicts = stats['conflicts'] - self.conflicts
+        self.decisions = stats['decisions']
+        self.conflicts = stats['conflicts']
+        return (0, decisions, conflicts)
+
+    def get_solution(self):
+        """
+        (None) -> [int]
+
+        Return the satisfying variable assignments found by the
+        last call to solve.
+        """
+
+        return self.solver.get_model()
+
+def interruptible(name='cadical153'):
+    """
+    (str) -> bool
+
+    Return whether the python-sat solver of the given name can be
+    interrupted, which the incremental backends need for a timeout.
+    """
+
+    if Solver is None:
+        raise ImportError('the incremental backend needs python-sat (pip install python-sat)')
+    with Solver(name=name) as probe:
         try:
-            while next(words) != 'Level':
-                pass
-            level = int(next(words))
-            while next(words) != 'Decisions':
-                pass
-            decisions = int(next(words))
-            while next(words) != 'Conflict':
-                pass
-            # we have one more string to get out of the way, 'Clauses'
-            next(words)
-            conflicts = int(next(words))
-            while str(next(words)) != 'RESULT:':
-                pass
-            answer = str(next(words))
-            if answer == 'SAT':
-                sat = True
-            elif answer == 'UNSAT':
-                sat = False
-            else:
-                print("Error: SAT/UNSAT not indicated.")
-        except StopIteration:
-                print("Error: Unexpected file end.")
+            probe.clear_interrupt()
+        except NotImplementedError:
+            return False
+    return True
 
-    return (sat, level, decisions, conflicts)
+def assumptions_of(givens):
+    """
+    ([[int]]) -> [int]
 
-def get_solution(result, satsolver = 'zchaff'):
+    Return the literals of a puzzle's givens, which must be unit
+    clauses, to be passed to a solver as assumptions.
     """
-    ([str]) -> [str]
 
-    Read solver output for a satisfiable instance and
-    return a list of satisfying variable assignments.
+    assumptions = []
+    for clause in givens:
+        if len(clause) != 1:
+            raise ValueError('givens must be unit clauses, got ' + str(clause))
+        assumptions.append(int(clause[0]))
+    return assumptions
+
+class LazyStripeSolver(IncrementalSolver):
+    """
+    Solves sudoku stripe puzzles without the stripe encoding: the
+    solver holds only the sudoku rules, and stripe constraints are
+    added for a puzzle only when a solution without a stripe turns
+    up (counterexample-guided refinement).
+
+    A solution grid without a stripe is first ruled out by a clause
+    blocking it; after max_blocks such grids, the puzzle instead gets
+    a clause requiring one of the stripes its givens still allow,
+    each with a new variable that implies its cells. A puzzle whose
+    givens allow no stripe is unsatisfiable without any solving. A
+    puzzle's clauses are switched on by an activation literal that is
+    retired afterwards, so one solver serves all puzzles.
     """
 
-    var_list = []
+    def __init__(self, size=9, name='cadical153', max_blocks=2):
+        IncrementalSolver.__init__(self, encode_sudoku(size, size, size, vectorized=True), name)
+        self.n_cells = size * size
+        self.n_variables = size ** 3
+        self.options = stripe_options(create_variables(size, size, size))
+        self.next_variable = self.n_variables + 1
+        self.max_blocks = max_blocks
+        self.refinements = 0
+        self.model = None
+
+    def solve(self, givens, timeout=None):
+        """
+        ([[int]], float) -> (bool, int, int, int)
 
-    words = iter(result)
+        Solve a puzzle as sudoku stripe and return its metrics as
+        IncrementalSolver.solve does, summed over all the solver
+        calls it took; self.refinements is the number of grids
+        without a stripe that came up first.
+        """
 
-    if(satsolver == 'cadical'):
+        assumptions = assumptions_of(givens)
+        self.refinements = 0
+        self.model = None
+
+        # the stripes whose cells the givens do not contradict
+        size = self.options.shape[1]
+        given = np.zeros(self.n_cells + 1, np.int64)
+        literals = np.array([literal for literal in assumptions if 0 < literal <= self.n_variables], np.int64)
+        given[(literals - 1) // size + 1] = literals
+        cells = (self.options - 1) // size + 1
+        allowed = self.options[((given[cells] == 0) | (given[cells] == self.options)).all(axis=1)]
+        if len(allowed) == 0:
+            return (False,) + self.counters()
+
+        activation = self.next_variable
+        self.next_variable += 1
+        deadline = None if timeout is None else time.perf_counter() + timeout
         try:
-            while next(words) != 'v':
-                pass
-            var = next(words)
-            while var != '0':
-                if(var != 'v'):
-                    var_list.append(var)
-                var = next(words)
-        except StopIteration:
-                print("Error: Unexpected file end.")
+            while True:
+                remaining = None if deadline is None else deadline - time.perf_counter()
+                if remaining is not None and remaining <= 0:
+                    sat = None
+                    break
+                sat = self.run(assumptions + [activation], remaining)
+                if not sat:
+                    break
+                model = np.array(self.solver.get_model()[:self.n_variables])
+                if (model[allowed - 1] > 0).all(axis=1).any():
+                    self.model = model.tolist()
+                    break
+                self.refinements += 1
+                if self.refinements <= self.max_blocks:
+                    self.solver.add_clause([-activation] + (-model[model > 0]).tolist())
+                else:
+                    self.require_stripe(allowed, activation)
+        finally:
+            # retire the puzzle's clauses for good
+            self.solver.add_clause([-activation])
+        return (sat,) + self.counters()
+
+    def require_stripe(self, allowed, activation):
+        """
+        (np.array, int) -> None
+
+        Add, under the activation literal, a clause requiring one of
+        the allowed stripes, each a new variable implying its cells.
+        """
+
+        stripes = self.next_variable + np.arange(len(allowed))
+        self.next_variable += len(allowed)
+        self.solver.add_clause([-activation] + stripes.tolist())
+        for stripe, cells in zip(stripes.tolist(), allowed.tolist()):
+            for cell in cells:
+                self.solver.add_clause([-stripe, cell])
+
+    def get_solution(self):
+        """
+        (None) -> [int]
+
+        Return the cell variable assignments of the solution found by
+        the last call to solve.
+        """
+
+        return self.model
+
+# incremental solvers of the current process, keyed by rule set
+_incremental = {}
+
+def incremental_solver(rules, name='cadical153'):
+    """
+    ([[int]], str) -> IncrementalSolver
+
+    Return this process's incremental solver for the given rule set,
+    loading the rules on first use.
+    """
+
+    return cached_for(_incremental, rules, lambda rules: IncrementalSolver(rules, name), name)
+
+# lazy stripe solvers of the current process, keyed by solver name
+_lazy = {}
+
+def lazy_stripe_solver(name='cadical153'):
+    """
+    (str) -> LazyStripeSolver
+
+    Return this process's lazy sudoku stripe solver, creating it on
+    first use.
+    """
+
+    if name not in _lazy:
+        _lazy[name] = LazyStripeSolver(name=name)
+    return _lazy[name]
+
+# CDCL solvers of the current process loaded with a rule set, keyed by rule set
+_cdcl = {}
 
+def load_cdcl(rules):
+    """
+    ([[int]]) -> CDCLSolver
+
+    Return a built-in CDCL solver holding the given rules.
+    """
+
+    loaded = CDCLSolver()
+    loaded.add_clauses(rules)
+    return loaded
+
+def solve_cdcl(givens, rules=None, timeout=None):
+    """
+    ([[int]], [[int]], float) -> ((bool, int, int, int), [int], dict)
+
+    Solve rules + givens with the built-in CDCL solver and return the
+    metrics as get_metrics does, the model (empty if unsatisfiable)
+    and the solver's full statistics. If timeout seconds pass first,
+    satisfiability is None. Each rule set is loaded once per
+    process and copied for every puzzle, so the metrics of a puzzle do
+    not depend on the puzzles solved before it. Without rules, givens
+    is the whole cnf.
+    """
+
+    if rules is None:
+        backend = CDCLSolver()
     else:
-        try:
-            while next(words) != 'Satisfiable':
-                pass
-            var = next(words)
-            while var != 'Random':
-                var_list.append(var)
-                var = next(words)
-        except StopIteration:
-                print("Error: Unexpected file end.")
-
-    return var_list
+        backend = cached_for(_cdcl, rules, load_cdcl).copy()
+
+    backend.add_clauses(givens)
+    sat = backend.solve(time_limit=timeout)
+    stats = backend.stats
+    metrics = (sat, stats['max_level'], stats['decisions'], stats['learned'])
+
+    return metrics, backend.model or [], dict(stats)
+
+# rule sets of the current process as lists for pycosat, keyed by rule set
+_pycosat = {}
+
+def pycosat_clauses(givens, rules=None):
+    """
+    ([[int]], [[int]]) -> [[int]]
+
+    Return rules + givens as the lists of ints pycosat takes. Each
+    rule set is converted once per process.
+    """
+
+    givens = [[int(literal) for literal in clause] for clause in givens]
+    if rules is None:
+        return givens
+    return cached_for(_pycosat, rules, lambda rules: rules.to_lists() if isinstance(rules, ClauseStore)
+                      else [list(map(int, clause)) for clause in rules]) + givens
+
+def solve_pycosat(givens, rules=None, timeout=None):
+    """
+    ([[int]], [[int]], float) -> ((bool, int, int, int), [int])
+
+    Solve rules + givens with pycosat in this process, without
+    writing a cnf, and return the metrics as get_metrics does and the
+    model (empty if unsatisfiable). pycosat reports no statistics,
+    so max level, decisions and conflicts are always 0, and it
+    cannot be interrupted, so it has no timeout. Without rules,
+    givens is the whole cnf.
+    """
+
+    if timeout is not None:
+        raise ValueError('pycosat cannot be interrupted, so it has no timeout')
+    model = pycosat.solve(pycosat_clauses(givens, rules))
+    if model == 'UNSAT':
+        return (False, 0, 0, 0), []
+    return (True, 0, 0, 0), model
+
+def count_models(givens, rules=None, limit=2, n_variables=729):
+    """
+    ([[int]], [[int]], int, int) -> int
+
+    Count the models of rules + givens up to limit, with pycosat.
+    Models that agree on the first n_variables variables (the cells
+    of a 9x9 sudoku) count once: after each model, a clause blocking
+    its true cell variables is added and the solver is run again, so
+    auxiliary variables never add to the count.
+    """
+
+    clauses = pycosat_clauses(givens, rules)
+    count = 0
+    while count < limit:
+        model = pycosat.solve(clauses)
+        if model == 'UNSAT':
+            break
+        count += 1
+        # exactly one number per cell, so the true cell variables fix the solution
+        clauses.append([-literal for literal in model[:n_variables] if literal > 0])
+    return count
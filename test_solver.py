@@ -0,0 +1,225 @@
+# Hunter McKnight
+# KRCourse 2017
+
+import unittest
+from solver import BACKENDS
+
+# output of glucose 4.1 (glucose -model) on a satisfiable cnf; its
+# comments contain a lone 's' for seconds
+GLUCOSE_SAT = '''c
+c This is glucose 4.1 --  based on MiniSAT (Many thanks to MiniSAT team)
+c
+c Reading from standard input... Use '--help' for help.
+c ========================================[ Problem Statistics ]===========================================
+c |                                                                                                       |
+c |  Number of variables:           900                                                                   |
+c |  Number of clauses:           12018                                                                   |
+c |  Parse time:                   0.00 s                                                                 |
+c |                                                                                                       |
+c | Preprocesing is fully done
+c |  Eliminated clauses:           0.00 Mb                                                                |
+c |  Simplification time:          0.00 s                                                                 |
+c |                                                                                                       |
+c ========================================[ MAGIC CONSTANTS ]==============================================
+c | Constants are supposed to work well together :-)                                                      |
+c | however, if you find better choices, please let us known...                                           |
+c |-------------------------------------------------------------------------------------------------------|
+c |                                |                                |                                     |
+c | - Restarts:                    | - Reduce Clause DB:            | - Minimize Asserting:               |
+c |   * LBD Queue    :     50      |   * First     :   2000         |    * size <  30                     |
+c |   * Trail  Queue :   5000      |   * Inc       :    300         |    * lbd  <   6                     |
+c |   * K            :   0.80      |   * Special   :   1000         |                                     |
+c |   * R            :   1.40      |   * Protected :  (lbd)< 30     |                                     |
+c |                                |                                |                                     |
+c ==================================[ Search Statistics (every  10000 conflicts) ]=========================
+c |                                                                                                       |
+c |          RESTARTS           |          ORIGINAL         |              LEARNT              | Progress |
+c |       NB   Blocked  Avg Cfc |    Vars  Clauses Literals |   Red   Learnts    LBD2  Removed |          |
+c =========================================================================================================
+c last restart ## conflicts  :  12 4
+c =========================================================================================================
+c restarts              : 1
+c nb ReduceDB           : 0
+c nb removed Clauses    : 0
+c nb learnts DL2        : 3
+c nb learnts size 2     : 3
+c nb learnts size 1     : 0
+c conflicts             : 12             (inf /sec)
+c decisions             : 40             (0.00 % random) (inf /sec)
+c propagations          : 3456           (inf /sec)
+c nb reduced Clauses    : 0
+c CPU time              : 0.004 s
+
+s SATISFIABLE
+v 1 -2 -3 4 0
+'''
+
+GLUCOSE_UNSAT = '''c
+c This is glucose 4.1 --  based on MiniSAT (Many thanks to MiniSAT team)
+c
+c ========================================[ Problem Statistics ]===========================================
+c |                                                                                                       |
+c |  Number of variables:           900                                                                   |
+c |  Number of clauses:           12019                                                                   |
+c |  Parse time:                   0.00 s                                                                 |
+c |                                                                                                       |
+c restarts              : 1
+c conflicts             : 7              (inf /sec)
+c decisions             : 9              (0.00 % random) (inf /sec)
+c propagations          : 1201           (inf /sec)
+c CPU time              : 0.003 s
+
+s UNSATISFIABLE
+'''
+
+# output of cadical 1.5 (statistics after the result, model over
+# several lines)
+CADICAL_SAT = '''c ---- [ banner ] ------------------------------------------------------------
+c
+c CaDiCaL Simplified Satisfiability Solver
+c Copyright (c) 2016-2021 A. Biere, M. Fleury, F. Pollitt
+c
+c Version 1.5.3 7f0a4a7bb37a1b5e7e9ba19b08fab2f2b9b5d6d8
+c
+c ---- [ parsing input ] -----------------------------------------------------
+c
+c reading DIMACS file from '<stdin>'
+c found 'p cnf 4 3' header
+c parsed 3 clauses in 0.00 seconds process time
+c
+c ---- [ options ] -----------------------------------------------------------
+c
+c all options are set to their default value
+c
+c ---- [ solving ] -----------------------------------------------------------
+c
+c  seconds  MB reductions      redundant irredundant
+c         MB    restarts       trail       variables
+c          level     conflicts       glue
+c
+c *  0.00  0  0  0  0   0   0   0%  0 0 3   0  4 100%
+c l  0.00  0  1  0  0   2   0  50%  1 0 3   0  4 100%
+c
+c ---- [ result ] ------------------------------------------------------------
+c
+s SATISFIABLE
+v 1 -2
+v -3 4 0
+c
+c ---- [ run-time profiling ] ------------------------------------------------
+c
+c         0.00   50.00% search
+c         0.00   50.00% parse
+c   =================================
+c         0.00  100.00% total
+c
+c ---- [ statistics ] --------------------------------------------------------
+c
+c chronological:                 0         0.00 %  of conflicts
+c conflicts:                     2         0.00    per second
+c decisions:                     5         0.00    per second
+c fixed:                         0         0.00 %  of all variables
+c learned:                       2       100.00 %  per conflict
+c learned_lits:                  2       100.00 %  learned literals
+c propagations:                 11         0.00    per second
+c restarts:                      0         0.00    interval
+c
+c seconds are measured in process time for solving
+c
+c ---- [ resources ] ---------------------------------------------------------
+c
+c total process time since initialization:         0.00    seconds
+c total real time since initialization:            0.00    seconds
+c maximum resident set size of process:            6.25    MB
+c
+c ---- [ shutting down ] -----------------------------------------------------
+c
+c exit 10
+'''
+
+# output of kissat 3.1
+KISSAT_SAT = '''c ---- [ banner ] ------------------------------------------------------------
+c
+c Kissat SAT Solver
+c
+c Copyright (c) 2021-2023 Armin Biere University of Freiburg
+c Copyright (c) 2019-2021 Armin Biere Johannes Kepler University Linz
+c
+c Version 3.1.1 71caafb4d182ced9f76cef45b00f37c598f588b5
+c
+c ---- [ parsing ] -----------------------------------------------------------
+c
+c opened and reading DIMACS file:
+c
+c   <stdin>
+c
+c parsed 'p cnf 4 3' header
+c closing input after reading 38 bytes
+c finished parsing after 0.00 seconds
+c
+c ---- [ solving ] -----------------------------------------------------------
+c
+c  seconds switched rate      trail   variables
+c         MB reductions conflicts glue remaining
+c          level restarts redundant irredundant
+c
+c *  0.00  1 0 0 0  0 0   0% 0 0 3 4 100%
+c {  0.00  1 0 0 0  0 0   0% 0 0 3 4 100%
+c }  0.00  1 0 0 0  3 1   0% 1 1 3 4 100%
+c 1  0.00  1 0 0 0  3 1   0% 1 1 3 4 100%
+c
+c ---- [ result ] ------------------------------------------------------------
+c
+s SATISFIABLE
+v 1 -2 -3 4 0
+c
+c ---- [ profiling ] ---------------------------------------------------------
+c
+c           0.00   50.00 %  parse
+c           0.00   50.00 %  search
+c           0.00    0.00 %  simplify
+c =============================================
+c           0.00  100.00 %  total
+c
+c ---- [ statistics ] --------------------------------------------------------
+c
+c conflicts:                                1              inf per second
+c decisions:                                3             3.00 per conflict
+c propagations:                             8              inf per second
+c
+c ---- [ resources ] ---------------------------------------------------------
+c
+c maximum-resident-set-size:          4014080 bytes          4 MB
+c process-time:                                              0.00 seconds
+c
+c ---- [ shutdown ] ----------------------------------------------------------
+c
+c exit 10
+'''
+
+class CompetitionParserTest(unittest.TestCase):
+    """
+    Parse real solver output in the SAT competition format.
+    """
+
+    def parse(self, solver, output):
+        return BACKENDS[solver].parse(output.splitlines(True))
+
+    def test_glucose_sat(self):
+        self.assertEqual(self.parse('glucose', GLUCOSE_SAT), ((True, 0, 40, 12), ['1', '-2', '-3', '4']))
+
+    def test_glucose_unsat(self):
+        self.assertEqual(self.parse('glucose', GLUCOSE_UNSAT), ((False, 0, 9, 7), []))
+
+    def test_cadical_sat(self):
+        self.assertEqual(self.parse('cadical', CADICAL_SAT), ((True, 0, 5, 2), ['1', '-2', '-3', '4']))
+
+    def test_kissat_sat(self):
+        self.assertEqual(self.parse('kissat', KISSAT_SAT), ((True, 0, 3, 1), ['1', '-2', '-3', '4']))
+
+    def test_output_cut_short(self):
+        # no verdict yet: satisfiability stays None
+        self.assertEqual(self.parse('glucose', GLUCOSE_SAT[:GLUCOSE_SAT.index('s SAT')]), ((None, 0, 40, 12), []))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+# Hunter McKnight
+# KRCourse 2017
+
+import csv
+import time
+import numpy as np
+
+# the stages of solving one puzzle under one rule set, in order
+STAGES = ('canonicalize', 'encode', 'cache', 'preprocess', 'render', 'write', 'spawn', 'solve', 'parse', 'decode')
+
+# upper edges in seconds of the histogram bins; the last bin is open
+BIN_EDGES = (1e-5, 1e-4, 1e-3, 1e-2, 1e-1, 1.0, 10.0)
+BIN_LABELS = ('<10us', '<100us', '<1ms', '<10ms', '<100ms', '<1s', '<10s', '>=10s')
+
+def add_time(timings, stage, start):
+    """
+    (dict, str, float) -> float
+
+    Add the time since start, a time.perf_counter() reading, to the
+    stage's total in timings, unless timings is None. Return the
+    current reading, so consecutive stages can be chained.
+    """
+
+    now = time.perf_counter()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + now - start
+    return now
+
+def timed_lines(lines, timings, stage='solve'):
+    """
+    (iterable of str, dict, str) -> generator of str
+
+    Yield the lines of a solver's output, adding the time spent
+    waiting for each line to the stage, so that waiting on the solver
+    can be told apart from parsing what it wrote.
+    """
+
+    lines = iter(lines)
+    while True:
+        start = time.perf_counter()
+        line = next(lines, None)
+        add_time(timings, stage, start)
+        if line is None:
+            return
+        yield line
+
+class TimingReport(object):
+    """
+    Per-puzzle, per-stage timings of a run: written one row per
+    puzzle to a sidecar csv file and summarized as a histogram of
+    each stage's times and the throughput in puzzles per second.
+    """
+
+    def __init__(self, path='timings.csv', mode='w'):
+        self.output = open(path, mode, newline='')
+        self.csv = csv.writer(self.output)
+        if self.output.tell() == 0:
+            self.csv.writerow(('puzzle',) + tuple(rules + '_' + stage for rules in ('x', 'stripe')
+                                                  for stage in STAGES + ('total',)))
+        self.start = time.perf_counter()
+        self.puzzles = 0
+        self.totals = dict((stage, 0.0) for stage in STAGES)
+        self.counts = dict((stage, np.zeros(len(BIN_LABELS), np.int64)) for stage in STAGES)
+
+    def add(self, indices, timings):
+        """
+        ([int], [(dict, dict)]) -> None
+
+        Record the x-sudoku and sudoku stripe timings of a group of
+        puzzles.
+        """
+
+        rows = []
+        for i, (x_timings, stripe_timings) in zip(indices, timings):
+            row = [i]
+            for rules_timings in (x_timings, stripe_timings):
+                row += ['{:.6f}'.format(rules_timings.get(stage, 0.0)) for stage in STAGES]
+                row.append('{:.6f}'.format(sum(rules_timings.values())))
+            rows.append(row)
+        self.csv.writerows(rows)
+        self.output.flush()
+
+        self.puzzles += len(indices)
+        for stage in STAGES:
+            seconds = np.array([rules_timings[stage] for pair in timings for rules_timings in pair
+                                if stage in rules_timings])
+            self.totals[stage] += seconds.sum()
+            self.counts[stage] += np.bincount(np.searchsorted(BIN_EDGES, seconds), minlength=len(BIN_LABELS))
+
+    def summary(self):
+        """
+        (None) -> str
+
+        Return the throughput so far and, for each stage that took
+        any time, its share of the total time and a histogram of its
+        per-puzzle times.
+        """
+
+        elapsed = time.perf_counter() - self.start
+        lines = [str(self.puzzles) + ' puzzles in ' + '{:.1f}'.format(elapsed) + 's, '
+                 + '{:.1f}'.format(self.puzzles / elapsed if elapsed > 0 else 0.0) + ' puzzles per second']
+        total = sum(self.totals.values())
+        for stage in STAGES:
+            if self.counts[stage].sum() == 0:
+                continue
+            histogram = ' '.join(label + ':' + str(count) for label, count in zip(BIN_LABELS, self.counts[stage])
+                                 if count)
+            lines.append('  {:<13}{:>9.3f}s {:>5.1f}%  '.format(stage, self.totals[stage],
+                                                                  100 * self.totals[stage] / total if total else 0.0)
+                         + histogram)
+        return '\n'.join(lines)
+
+    def close(self):
+        self.output.close()
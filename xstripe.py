@@ -1,118 +1,1218 @@
 # Hunter McKnight
 # KRCourse 2017
 
+import argparse
 import csv
+import itertools
+import multiprocessing
+import os
+import re
+import shutil
 import sys
-from extract import extract, encode_all, compress, decode
+import tempfile
+import time
+import numpy as np
+from extract import iter_puzzles, count_puzzles, encode, decode_all, write_solutions
 from solver import *
-from sat_encoding import encode_sudoku, sat_to_sudoku
+from preprocess import propagate_givens, expand_model
+from result_cache import ResultCache, puzzle_key, canonicalize, restore_solution
+from sat_encoding import AMO_ENCODINGS, CONSTRAINTS, ENCODING_CACHE, create_variables, encode_rule_set, \
+    encode_sudoku, encoder_fingerprint, load_encoding, load_rule_set, rule_set_name, stripe_candidates, \
+    stripe_candidates_store, variant_modules
+from schedule import hardest_first, load_costs
+from timing import TimingReport, add_time
 
-def solve_as(puzzle, rules, satsolver= 'zchaff'):
+# state of the current worker process, filled in by init_worker
+_worker = {}
+# the cell variables of the 9x9 rules
+VARIABLES = create_variables(9, 9, 9)
+# the variants compared by default
+VARIANTS = ('x', 'stripe')
+
+def solve_external(clauses, satsolver='zchaff', cnf_path='query.cnf', rules=None, pipe=False, stats=None,
+                   portfolio=None, timeout=None, timings=None):
+    """
+    ([[int]], str, str, [[int]], bool, dict, [str], float, dict) -> ((bool, int, int, int), [str])
+
+    Solve a cnf with an external solver, or race the solvers of a
+    portfolio on it, and note in stats which solver answered and
+    whether the time ran out.
+    """
+
+    if portfolio is None and timeout is None:
+        metrics, solution = run_solver(clauses, satsolver, cnf_path, rules, pipe, timings)
+        winner = satsolver
+    else:
+        metrics, solution, winner = run_portfolio(clauses, portfolio or [satsolver], cnf_path, rules, pipe, timeout,
+                                                  timings)
+    if stats is not None:
+        stats['solver'] = winner
+        stats['timeout'] = winner is None
+    return metrics, solution
+
+def solve_in_process(puzzle, rules, satsolver, stats=None, timeout=None, timings=None):
+    """
+    ([[int]], [[int]], str, dict, float, dict) -> ((bool, int, int, int), [int])
+
+    Solve rules + puzzle with the built-in CDCL solver, with pycosat
+    or, for 'incremental', with the long-lived solver of the rule
+    set, or, for 'lazy', as sudoku stripe with the lazy stripe
+    solver, and note in stats which solver answered and whether the
+    time ran out.
+    """
+
+    start = time.perf_counter()
+    if satsolver == 'cdcl':
+        metrics, solution, solver_stats = solve_cdcl(puzzle, rules, timeout)
+        if stats is not None:
+            stats.update(solver_stats)
+    elif satsolver == 'pycosat':
+        metrics, solution = solve_pycosat(puzzle, rules, timeout)
+    elif satsolver == 'lazy':
+        backend = lazy_stripe_solver()
+        metrics = backend.solve(puzzle, timeout)
+        solution = backend.get_solution() if metrics[0] else ''
+        if stats is not None:
+            stats['refinements'] = backend.refinements
+    else:
+        backend = incremental_solver(rules)
+        metrics = backend.solve(puzzle, timeout)
+        solution = backend.get_solution() if metrics[0] else ''
+    add_time(timings, 'solve', start)
+
+    timed_out = metrics[0] is None
+    if stats is not None:
+        stats['solver'] = None if timed_out else satsolver
+        stats['timeout'] = timed_out
+    if timed_out:
+        metrics = (False,) + tuple(metrics[1:])
+    return metrics, solution if metrics[0] else ''
+
+def solve_as(puzzle, rules, satsolver= 'zchaff', cnf_path='query.cnf', pipe=False, stats=None,
+             preprocess=False, cache=None, key=None, portfolio=None, timeout=None, timings=None):
     """
     ([[int]], [[int]]) -> bool, (int, int, int)
 
     Solve the given puzzle as according to the given
     rules and return the most relevant zchaff output:
     satisfiability and solver metrics.
+
+    With satsolver 'cdcl', the puzzle is solved by the built-in
+    solver, which also fills the stats dict, if given, with its
+    learned clauses, propagations, restarts and time.
+
+    With satsolver 'pycosat', the puzzle is solved by pycosat in
+    this process, without writing a cnf.
+
+    With satsolver 'incremental', the rules are loaded once into a
+    long-lived solver and the puzzle's givens become assumptions.
+    With 'lazy', the puzzle is solved as sudoku stripe by adding
+    stripe constraints only when a solution lacks a stripe; the
+    rules are not used.
+    Otherwise the rules are rendered to DIMACS once and only the
+    givens are rendered per puzzle; with pipe, solvers that can
+    read the cnf from their stdin do so.
+
+    With a portfolio, a list of external solvers, they all run on
+    the cnf at once and the first verdict wins. With a timeout, a
+    puzzle gets that many seconds; if they run out, the solvers are
+    stopped and the puzzle counts as unsatisfiable. Either way, the
+    stats dict, if given, records the 'solver' that answered (None
+    if none did) and whether there was a 'timeout'.
+
+    With preprocess, the givens are first propagated through the
+    rules and only the simplified remainder goes to the solver; the
+    solution is mapped back to the original variables. The
+    incremental backend needs the rules unchanged, so it cannot
+    preprocess.
+
+    With a ResultCache, the result stored under key, a (puzzle,
+    rules, solver) tuple, is returned if there is one; otherwise the
+    new result is stored, unless the time ran out.
+
+    If a timings dict is given, the seconds spent in each stage of
+    solving are added to it under the names in timing.STAGES.
     """
 
-    full_cnf = rules + puzzle
+    start = time.perf_counter()
+    if cache is not None:
+        hit = cache.get(key)
+        add_time(timings, 'cache', start)
+        if hit is None:
+            solved = {} if stats is None else stats
+            hit = solve_as(puzzle, rules, satsolver, cnf_path, pipe, solved, preprocess,
+                           portfolio=portfolio, timeout=timeout, timings=timings)
+            if not solved.get('timeout'):
+                start = time.perf_counter()
+                cache.put(key, *hit)
+                add_time(timings, 'cache', start)
+        elif stats is not None:
+            stats['solver'] = 'cache'
+            stats['timeout'] = False
+        return hit
 
-    result = solve(full_cnf, satsolver)
+    if preprocess:
+        reduced = propagate_givens(rules, puzzle)
+        add_time(timings, 'preprocess', start)
+        if reduced is None or len(reduced[0]) == 0:
+            # propagation alone decides the puzzle
+            if stats is not None:
+                stats['solver'] = 'preprocess'
+                stats['timeout'] = False
+            if reduced is None:
+                # the givens contradict the rules
+                return (False, 0, 0, 0), ''
+            return (True, 0, 0, 0), expand_model([], reduced[1], reduced[2])
+        clauses, original, fixed = reduced
+        if satsolver in ('incremental', 'lazy'):
+            raise ValueError('the ' + satsolver + ' backend cannot preprocess')
+        elif satsolver in ('cdcl', 'pycosat') and portfolio is None:
+            metrics, solution = solve_in_process(clauses, None, satsolver, stats, timeout, timings)
+        else:
+            metrics, solution = solve_external(clauses, satsolver, cnf_path, pipe=pipe, stats=stats,
+                                               portfolio=portfolio, timeout=timeout, timings=timings)
+        if metrics[0]:
+            start = time.perf_counter()
+            solution = expand_model(solution, original, fixed)
+            add_time(timings, 'preprocess', start)
+        return metrics, solution
 
-    metrics = get_metrics(result, satsolver)
+    if satsolver in ('cdcl', 'pycosat', 'incremental', 'lazy') and portfolio is None:
+        return solve_in_process(puzzle, rules, satsolver, stats, timeout, timings)
 
-    if metrics[0]:
-        solution = get_solution(result, satsolver)
-    else:
+    metrics, solution = solve_external(puzzle, satsolver, cnf_path, rules, pipe, stats, portfolio, timeout, timings)
+
+    if not metrics[0]:
         solution = ''
 
     return metrics, solution
 
-def main(satsolver = 'zchaff'):
+def init_worker(x_rules, stripe_rules, satsolver, scratch_dir=None, pipe=False, preprocess=False,
+                result_cache=None, canonical=False, rules_keys=('x', 'stripe'), portfolio=None, timeout=None,
+                timing=False, stripe_prefilter=False):
     """
-    (None) -> None
+    ([[int]], [[int]], str, str, bool, bool, str, bool, (str, str), [str], float, bool, bool) -> None
 
-    Try to solve a database of puzzles as both x-sudoku
-    and sudoku stripes. Print a file of solution metrics.
+    Prepare the current process to solve puzzles. Each worker
+    gets its own scratch cnf file in scratch_dir; without a
+    scratch_dir the solver writes query.cnf as before. Each worker
+    opens its own connection to the result_cache file, if any,
+    where results are filed under rules_keys.
+
+    With stripe_prefilter, stripe_rules are the sudoku rules alone,
+    and each puzzle adds the stripes its givens allow.
     """
 
-    print('Extracting puzzles from sudoku17.txt...')
-    puzzles = extract()
-    print('Extracted.')
-    # for testing purposes, use only the first 100 puzzles
-    # for experiment, use all puzzles
-    print('Encoding puzzles as cnfs...')
-    puzzle_cnfs = encode_all(puzzles)
-    print('Encoded.')
+    _worker['x_rules'] = x_rules
+    _worker['stripe_rules'] = stripe_rules
+    _worker['satsolver'] = satsolver
+    _worker['pipe'] = pipe
+    _worker['preprocess'] = preprocess
+    _worker['canonical'] = canonical
+    _worker['portfolio'] = portfolio
+    _worker['timeout'] = timeout
+    _worker['timing'] = timing
+    if stripe_prefilter:
+        # candidate stripe variables come after those of the rules
+        _worker['candidate_start'] = stripe_rules.max_variable() + 1
+    if scratch_dir is None:
+        _worker['cnf_path'] = 'query.cnf'
+    else:
+        _worker['cnf_path'] = os.path.join(scratch_dir, 'query-' + str(os.getpid()) + '.cnf')
+    if result_cache is None:
+        _worker['cache'] = None
+    else:
+        _worker['cache'] = ResultCache(result_cache)
+        solver_key = solver_setup_key(satsolver, portfolio, preprocess)
+        _worker['x_key'] = (rules_keys[0], solver_key)
+        _worker['stripe_key'] = (rules_keys[1], solver_key)
+
+def solver_setup_key(satsolver, portfolio=None, preprocess=False):
+    """
+    (str, [str], bool) -> str
+
+    Identify the solver (or portfolio) results are filed under in
+    the result cache, including the version of each solver and
+    whether the givens were preprocessed.
+    """
+
+    if portfolio is None:
+        solver_key = solver_version(satsolver)
+    else:
+        solver_key = '+'.join(solver_version(member) for member in portfolio)
+    return solver_key + ('-preprocess' if preprocess else '')
+
+def solve_puzzle(puzzle, candidates=None):
+    """
+    (np.array, np.array) -> ((bool, int, int, int), [str], (bool, int, int, int), [str], (dict, dict))
+
+    Solve one puzzle as both x-sudoku and sudoku stripe using
+    the rules and scratch file of the current worker.
+
+    With candidates, the puzzle's row of stripe_candidates, only
+    those stripes are encoded for the sudoku stripe, and without any
+    the puzzle is unsatisfiable without calling the solver.
+
+    With a portfolio or timeout, each metrics tuple also says
+    whether the time ran out and which solver answered.
+
+    With canonical, the x-sudoku is solved in the canonical form of
+    its symmetry class, so that equivalent puzzles share results.
+
+    With timing, the last item holds the time spent in each stage
+    for the x-sudoku and the sudoku stripe; otherwise it is None.
+    """
+
+    if _worker['timing']:
+        x_timings = {}
+        stripe_timings = {}
+    else:
+        x_timings = stripe_timings = None
+
+    start = time.perf_counter()
+    x_puzzle = puzzle
+    if _worker['canonical']:
+        x_puzzle, transform = canonicalize(puzzle)
+        start = add_time(x_timings, 'canonicalize', start)
+
+    x_key = stripe_key = None
+    if _worker['cache'] is not None:
+        x_key = (puzzle_key(x_puzzle),) + _worker['x_key']
+        stripe_key = (puzzle_key(puzzle),) + _worker['stripe_key']
+
+    x_stats = {}
+    stripe_stats = {}
+    x_givens = encode(x_puzzle)
+    start = add_time(x_timings, 'encode', start)
+    # the lazy backend only knows sudoku stripe
+    x_solver = 'incremental' if _worker['satsolver'] == 'lazy' else _worker['satsolver']
+    x_metrics, x_solution = solve_as(x_givens, _worker['x_rules'], x_solver, _worker['cnf_path'],
+                                     _worker['pipe'], x_stats, preprocess=_worker['preprocess'],
+                                     cache=_worker['cache'], key=x_key,
+                                     portfolio=_worker['portfolio'], timeout=_worker['timeout'], timings=x_timings)
+    start = time.perf_counter()
+    stripe_givens = encode(puzzle)
+    if candidates is not None:
+        stripe_givens += stripe_candidates_store(VARIABLES, candidates, _worker['candidate_start']).to_lists()
+    add_time(stripe_timings, 'encode', start)
+    if candidates is not None and not candidates.any():
+        # the givens allow no stripe
+        stripe_metrics, stripe_solution = (False, 0, 0, 0), ''
+        stripe_stats['solver'] = 'prefilter'
+        stripe_stats['timeout'] = False
+    else:
+        stripe_metrics, stripe_solution = solve_as(stripe_givens, _worker['stripe_rules'], _worker['satsolver'],
+                                                   _worker['cnf_path'], _worker['pipe'], stripe_stats,
+                                                   preprocess=_worker['preprocess'], cache=_worker['cache'],
+                                                   key=stripe_key, portfolio=_worker['portfolio'],
+                                                   timeout=_worker['timeout'], timings=stripe_timings)
+
+    if _worker['canonical'] and x_metrics[0]:
+        start = time.perf_counter()
+        x_solution = restore_solution(x_solution, transform)
+        add_time(x_timings, 'canonicalize', start)
+
+    if _worker['portfolio'] is not None or _worker['timeout'] is not None:
+        x_metrics = tuple(x_metrics) + (x_stats['timeout'], x_stats['solver'])
+        stripe_metrics = tuple(stripe_metrics) + (stripe_stats['timeout'], stripe_stats['solver'])
+
+    timings = (x_timings, stripe_timings) if _worker['timing'] else None
+    return x_metrics, x_solution, stripe_metrics, stripe_solution, timings
+
+def solve_item(item):
+    """
+    ((np.array, np.array)) -> tuple
+
+    Solve a puzzle with its stripe candidates as solve_puzzle does.
+    """
+
+    return solve_puzzle(*item)
+
+def solve_indexed(item):
+    """
+    ((int, np.array, np.array)) -> (int, tuple)
+
+    Solve one puzzle with its stripe candidates (or None) as
+    solve_puzzle does and return its result with its position in the
+    batch.
+    """
+
+    index, puzzle, candidates = item
+    return index, solve_puzzle(puzzle, candidates)
+
+def hardest_first_results(pool, puzzles, order, candidates=None):
+    """
+    (multiprocessing.Pool, np.array, np.array, np.array) -> generator of tuple
+
+    Solve a batch of puzzles (with their stripe candidates, if any)
+    in the pool in the given order, one puzzle per task so that each
+    worker takes the next puzzle as soon as it is free, and yield
+    the results of solve_puzzle in puzzle order, holding back those
+    that finish early.
+    """
+
+    finished = {}
+    next_index = 0
+    items = ((int(j), puzzles[j], None if candidates is None else candidates[j]) for j in order)
+    for index, result in pool.imap_unordered(solve_indexed, items):
+        finished[index] = result
+        while next_index in finished:
+            yield finished.pop(next_index)
+            next_index += 1
+
+def init_variant_worker(variant_rules, satsolver, scratch_dir=None, pipe=False, preprocess=False,
+                        result_cache=None, rules_keys=(), portfolio=None, timeout=None):
+    """
+    ([ClauseStore], str, str, bool, bool, str, [str], [str], float) -> None
+
+    Prepare the current process to solve puzzles under each of a
+    list of variants' rule sets, as init_worker does for x-sudoku
+    and sudoku stripe. Results are filed in the result_cache under
+    the variant's rules_keys.
+    """
+
+    init_worker(None, None, satsolver, scratch_dir, pipe, preprocess, result_cache, portfolio=portfolio,
+                timeout=timeout)
+    _worker['variant_rules'] = variant_rules
+    if result_cache is not None:
+        solver_key = solver_setup_key(satsolver, portfolio, preprocess)
+        _worker['variant_keys'] = [(rules_key, solver_key) for rules_key in rules_keys]
+
+def solve_variants(puzzle):
+    """
+    (np.array) -> [((bool, int, int, int), [str])]
+
+    Solve one puzzle under the rule set of each of the current
+    worker's variants and return each variant's metrics and
+    solution. The puzzle is encoded once for all of them.
+
+    With a portfolio or timeout, each metrics tuple also says
+    whether the time ran out and which solver answered.
+    """
+
+    givens = encode(puzzle)
+    cache = _worker['cache']
+    if cache is not None:
+        puzzle_id = puzzle_key(puzzle)
+    results = []
+    for k, rules in enumerate(_worker['variant_rules']):
+        stats = {}
+        key = None if cache is None else (puzzle_id,) + _worker['variant_keys'][k]
+        metrics, solution = solve_as(givens, rules, _worker['satsolver'], _worker['cnf_path'], _worker['pipe'],
+                                     stats, preprocess=_worker['preprocess'], cache=cache, key=key,
+                                     portfolio=_worker['portfolio'], timeout=_worker['timeout'])
+        if _worker['portfolio'] is not None or _worker['timeout'] is not None:
+            metrics = tuple(metrics) + (stats['timeout'], stats['solver'])
+        results.append((metrics, solution))
+    return results
+
+def solution_class(count):
+    """
+    (int) -> str
+
+    Name the class of a puzzle with count solutions (counted up to a
+    limit of at least 2).
+    """
+
+    return ('unsat', 'unique')[count] if count < 2 else 'multiple'
+
+def init_classifier(x_rules, stripe_rules, limit=2):
+    """
+    ([[int]], [[int]], int) -> None
+
+    Prepare the current process to count the solutions of puzzles,
+    up to limit.
+    """
+
+    _worker['x_rules'] = x_rules
+    _worker['stripe_rules'] = stripe_rules
+    _worker['limit'] = limit
+
+def classify_puzzle(puzzle):
+    """
+    (np.array) -> (int, int)
+
+    Count the solutions of one puzzle as x-sudoku and as sudoku
+    stripe, up to the current worker's limit.
+    """
+
+    givens = encode(puzzle)
+    return (count_models(givens, _worker['x_rules'], _worker['limit']),
+            count_models(givens, _worker['stripe_rules'], _worker['limit']))
+
+METRICS_HEADER = ('x_satisfiable', 'x_max_level', 'x_num_decisions', 'x_conflicts', 'stripe_satisfiable', 'stripe_max_level', 'stripe_num_decisions', 'stripe_conflicts')
+# results are decoded and written this many puzzles at a time
+WRITE_EVERY = 100
+
+# extra columns of a run with a portfolio or a timeout
+RACE_HEADER = ('x_timeout', 'x_solver', 'stripe_timeout', 'stripe_solver')
+
+def complete_lines(path):
+    """
+    (str) -> [str]
+
+    Return the lines of a file that end in a line break, dropping
+    a last line that was cut short.
+    """
+
+    if not os.path.exists(path):
+        return []
+    with open(path, newline='') as lines:
+        return [line for line in lines if line.endswith('\n')]
+
+def rewrite_lines(path, lines):
+    """
+    (str, [str]) -> None
+
+    Replace the contents of a file with the given lines.
+    """
+
+    partial = path + '.tmp'
+    with open(partial, 'w', newline='') as output:
+        output.writelines(lines)
+        output.flush()
+        os.fsync(output.fileno())
+    os.replace(partial, path)
+
+def resume_outputs(metrics_file = 'metrics.csv', x_file = 'x-solutions.csv', stripe_file = 'stripe-solutions.csv',
+                   first = 0):
+    """
+    (str, str, str, int) -> (int, int, int, int)
+
+    Trim the output files of an interrupted run back to the last
+    puzzle whose results were all written, and return the number of
+    puzzles done and the counts of puzzles solvable as x-sudoku, as
+    sudoku stripe, and both ways. The run started at puzzle first.
+    """
+
+    metrics_lines = complete_lines(metrics_file)
+    rows = list(csv.reader(metrics_lines[1:]))
+    x_lines = complete_lines(x_file)
+    stripe_lines = complete_lines(stripe_file)
+    x_done = set(int(row[0]) for row in csv.reader(x_lines))
+    stripe_done = set(int(row[0]) for row in csv.reader(stripe_lines))
+
+    # a puzzle is done once its metrics and any solutions are written
+    done = 0
+    count_valid_x = 0
+    count_valid_stripe = 0
+    count_valid_both = 0
+    for row in rows:
+        x_sat = row[0] == 'True'
+        stripe_sat = row[4] == 'True'
+        if (x_sat and first + done not in x_done) or (stripe_sat and first + done not in stripe_done):
+            break
+        count_valid_x += x_sat
+        count_valid_stripe += stripe_sat
+        count_valid_both += x_sat and stripe_sat
+        done += 1
+
+    rewrite_lines(metrics_file, metrics_lines[:done + 1])
+    rewrite_lines(x_file, [line for line, row in zip(x_lines, csv.reader(x_lines)) if int(row[0]) < first + done])
+    rewrite_lines(stripe_file, [line for line, row in zip(stripe_lines, csv.reader(stripe_lines))
+                                if int(row[0]) < first + done])
+
+    return done, count_valid_x, count_valid_stripe, count_valid_both
+
+def checkpoint(outputs):
+    """
+    ([file]) -> None
+
+    Make sure everything written to the outputs so far is on disk.
+    """
+
+    for output in outputs:
+        output.flush()
+        os.fsync(output.fileno())
+
+def shard_range(n_puzzles, shard):
+    """
+    (int, (int, int)) -> (int, int)
+
+    Return the first puzzle and one past the last puzzle of shard
+    k of n, numbered from 1, so that the n shards split the puzzles
+    into contiguous ranges of nearly equal size.
+    """
+
+    k, n = shard
+    return (k - 1) * n_puzzles // n, k * n_puzzles // n
+
+def shard_path(path, shard):
+    """
+    (str, (int, int)) -> str
+
+    Return the name of an output file of shard k of n, e.g.
+    metrics.shard-2-of-4.csv for metrics.csv, or path itself if
+    shard is None.
+    """
+
+    if shard is None:
+        return path
+    root, extension = os.path.splitext(path)
+    return root + '.shard-' + str(shard[0]) + '-of-' + str(shard[1]) + extension
+
+def shard_of(path):
+    """
+    (str) -> (int, int)
+
+    Return the shard (k, n) whose output file path is, as named by
+    shard_path, or None for an output file of a whole run.
+    """
+
+    match = re.search(r'\.shard-(\d+)-of-(\d+)\.[^./]*$', path)
+    if match is None:
+        return None
+    return int(match.group(1)), int(match.group(2))
+
+def parse_shard(text):
+    """
+    (str) -> (int, int)
+
+    Read a shard specification 'k/n', with 1 <= k <= n.
+    """
+
+    match = re.match(r'^(\d+)/(\d+)$', text)
+    if match is None or not 1 <= int(match.group(1)) <= int(match.group(2)):
+        raise argparse.ArgumentTypeError('expected a shard k/n with 1 <= k <= n, not ' + repr(text))
+    return int(match.group(1)), int(match.group(2))
+
+def merge_shards(filename = 'sudoku17.txt', metrics_file = 'metrics.csv', x_file = 'x-solutions.csv',
+                 stripe_file = 'stripe-solutions.csv'):
+    """
+    (str, str, str, str) -> (int, int, int, int)
+
+    Combine the outputs of shards 1 to n of a run over the puzzles in
+    filename into the output files of a single run, in puzzle order.
+    Raise ValueError unless every shard is present and finished and
+    every puzzle has exactly one result, with a solution if and only
+    if it is satisfiable. Return the number of puzzles and the counts
+    of puzzles solvable as x-sudoku, as sudoku stripe, and both ways.
+    """
+
+    root, extension = os.path.splitext(metrics_file)
+    pattern = re.compile(re.escape(root) + r'\.shard-(\d+)-of-(\d+)' + re.escape(extension) + '$')
+    shards = set()
+    for path in os.listdir('.'):
+        match = pattern.match(path)
+        if match is not None:
+            shards.add((int(match.group(1)), int(match.group(2))))
+    if not shards:
+        raise ValueError('no shard outputs found for ' + metrics_file)
+    counts = set(n for k, n in shards)
+    if len(counts) > 1:
+        raise ValueError('found shards of runs split ' + ' and '.join(str(n) for n in sorted(counts)) + ' ways')
+    n = counts.pop()
+    missing = sorted(set(range(1, n + 1)) - set(k for k, _ in shards))
+    if missing:
+        raise ValueError('missing shards ' + ', '.join(str(k) for k in missing) + ' of ' + str(n))
+
+    n_puzzles = count_puzzles(filename)
+    header = None
+    metrics_lines = []
+    solution_lines = ({}, {})
+    for k in range(1, n + 1):
+        name = 'shard ' + str(k) + ' of ' + str(n)
+        first, last = shard_range(n_puzzles, (k, n))
+        lines = complete_lines(shard_path(metrics_file, (k, n)))
+        if header is None:
+            header = lines[:1]
+        elif lines[:1] != header:
+            raise ValueError(name + ' has different metrics columns')
+        rows = list(csv.reader(lines[1:]))
+        if len(rows) != last - first:
+            raise ValueError(name + ' has results for ' + str(len(rows)) + ' of its ' + str(last - first)
+                             + ' puzzles; finish it with --resume')
+        metrics_lines += lines[1:]
+
+        for path, solutions, column in ((x_file, solution_lines[0], 0), (stripe_file, solution_lines[1], 4)):
+            solved = complete_lines(shard_path(path, (k, n)))
+            for line, row in zip(solved, csv.reader(solved)):
+                index = int(row[0])
+                if not first <= index < last:
+                    raise ValueError(name + ' has a solution for puzzle ' + str(index) + ', outside its range')
+                if index in solutions:
+                    raise ValueError(name + ' has two solutions for puzzle ' + str(index))
+                solutions[index] = line
+            # every satisfiable puzzle has a solution, and only those
+            satisfiable = set(first + j for j, row in enumerate(rows) if row[column] == 'True')
+            if satisfiable != set(index for index in solutions if first <= index < last):
+                raise ValueError(name + ' has solutions that do not match its metrics in ' + shard_path(path, (k, n)))
+
+    rewrite_lines(metrics_file, header + metrics_lines)
+    rewrite_lines(x_file, [solution_lines[0][index] for index in sorted(solution_lines[0])])
+    rewrite_lines(stripe_file, [solution_lines[1][index] for index in sorted(solution_lines[1])])
+
+    both = set(solution_lines[0]) & set(solution_lines[1])
+    return n_puzzles, len(solution_lines[0]), len(solution_lines[1]), len(both)
+
+def load_rules(rule_cache = True, amo = 'pairwise', stripe_prefilter = False):
+    """
+    (bool, str, bool) -> (ClauseStore, ClauseStore)
+
+    Encode the x-sudoku and sudoku stripe rules, or load them from
+    the on-disk cache if rule_cache. With stripe_prefilter, the
+    second rule set is the sudoku rules without the stripes, which
+    are added per puzzle.
+    """
 
     print('Encoding rules for x-sudoku...')
-    x_rules = encode_sudoku(9, 9, 9, x = True)
+    if rule_cache:
+        x_rules = load_encoding(9, 9, 9, x = True, amo = amo)
+    else:
+        x_rules = encode_sudoku(9, 9, 9, x = True, vectorized = True, amo = amo)
     print('Encoded.')
     print('Encoding rules for sudoku stripe...')
-    stripe_rules = encode_sudoku(9, 9, 9, stripe = True)
+    if rule_cache:
+        stripe_rules = load_encoding(9, 9, 9, stripe = not stripe_prefilter, amo = amo)
+    else:
+        stripe_rules = encode_sudoku(9, 9, 9, stripe = not stripe_prefilter, vectorized = True, amo = amo)
     print('Encoded.')
+    return x_rules, stripe_rules
 
-    count_valid_x = 0
-    count_valid_stripe = 0
-    count_valid_both = 0
-    x_comparison_metrics = []
-    stripe_comparison_metrics = []
-    x_solutions = []
-    stripe_solutions = []
+def classify(filename = 'sudoku17.txt', workers = 1, batch_size = 10000, limit = 2, rule_cache = True,
+             amo = 'pairwise', output_file = 'classes.csv'):
+    """
+    (str, int, int, int, bool, str, str) -> {str: {str: int}}
+
+    Count the solutions of every puzzle as x-sudoku and as sudoku
+    stripe, up to limit, with pycosat, and write them to output_file
+    with each puzzle's class: unsat, unique or multiple. Return the
+    number of puzzles in each class, by rule set.
+    """
+
+    if limit < 2:
+        raise ValueError('telling unique puzzles apart needs a limit of at least 2, not ' + str(limit))
+    print('Found ' + str(count_puzzles(filename)) + ' puzzles in ' + filename + '.')
+    x_rules, stripe_rules = load_rules(rule_cache, amo)
+
+    if workers > 1:
+        pool = multiprocessing.Pool(workers, init_classifier, (x_rules, stripe_rules, limit))
+    else:
+        init_classifier(x_rules, stripe_rules, limit)
+
+    totals = dict((rules, dict((name, 0) for name in ('unsat', 'unique', 'multiple'))) for rules in ('x', 'stripe'))
+    print('Counting solutions...')
+    with open(output_file, 'w', newline='') as output:
+        output_csv = csv.writer(output)
+        output_csv.writerow(('puzzle', 'x_solutions', 'x_class', 'stripe_solutions', 'stripe_class'))
+        i = 0
+        for puzzles in iter_puzzles(filename, batch_size):
+            if workers > 1:
+                counts = pool.imap(classify_puzzle, puzzles, chunksize=16)
+            else:
+                counts = map(classify_puzzle, puzzles)
+            rows = []
+            for x_count, stripe_count in counts:
+                rows.append((i, x_count, solution_class(x_count), stripe_count, solution_class(stripe_count)))
+                totals['x'][solution_class(x_count)] += 1
+                totals['stripe'][solution_class(stripe_count)] += 1
+                i += 1
+            output_csv.writerows(rows)
+            output.flush()
+    if workers > 1:
+        pool.close()
+        pool.join()
+    print('Counted.')
+    return totals
+
+def check_options(satsolver = 'zchaff', preprocess = False, stripe_prefilter = False, portfolio = None,
+                  timeout = None):
+    """
+    (str, bool, bool, [str], float) -> None
+
+    Raise a ValueError if the options of a run do not go together, so
+    that it fails before any output file is opened.
+    """
+
+    if satsolver in ('incremental', 'lazy'):
+        if stripe_prefilter:
+            raise ValueError('the ' + satsolver + ' backend cannot take per-puzzle stripe clauses')
+        if preprocess:
+            raise ValueError('the ' + satsolver + ' backend cannot preprocess')
+        if timeout is not None and not interruptible():
+            raise ValueError('the ' + satsolver + ' backend cannot be interrupted, so it cannot take a timeout')
+    if satsolver == 'pycosat' and timeout is not None:
+        raise ValueError('pycosat cannot be interrupted, so it cannot take a timeout')
+    if portfolio is not None:
+        unknown = [member for member in portfolio if member not in BACKENDS]
+        if unknown:
+            raise ValueError('portfolio solvers must be external solvers, not ' + ', '.join(unknown))
+
+def check_schedule(schedule = None, shard = None, timings = None):
+    """
+    (str, (int, int), str) -> None
+
+    Raise a ValueError if the costs file of a hardest-first schedule
+    is also an output of the run, which would be emptied before its
+    costs are read.
+    """
+
+    if not schedule:
+        return
+    outputs = ['metrics.csv', 'x-solutions.csv', 'stripe-solutions.csv']
+    if timings is not None:
+        outputs.append(timings)
+    for output in outputs:
+        if os.path.realpath(shard_path(output, shard)) == os.path.realpath(schedule):
+            raise ValueError(schedule + ' is an output of this run; copy it elsewhere to schedule by it')
+
+def load_variants(variants, rule_cache = True, amo = 'pairwise'):
+    """
+    ([str], bool, str) -> [ClauseStore]
+
+    Encode the rule set of each variant, or load it from the on-disk
+    cache if rule_cache. The blocks of constraint modules shared by
+    several variants, such as the sudoku rules, are encoded once.
+    """
+
+    variant_rules = []
+    for variant in variants:
+        print('Encoding rules for ' + variant + '...')
+        modules = variant_modules(variant)
+        if rule_cache:
+            variant_rules.append(load_rule_set(modules, amo = amo))
+        else:
+            variant_rules.append(encode_rule_set(modules, VARIABLES, amo)[0])
+    print('Encoded.')
+    return variant_rules
+
+def compare_variants(variants = VARIANTS, satsolver = 'zchaff', workers = 1, filename = 'sudoku17.txt',
+                     batch_size = 10000, scratch_dir = None, pipe = False, rule_cache = True, checkpoint_every = 1000,
+                     preprocess = False, result_cache = None, portfolio = None, timeout = None, amo = 'pairwise'):
+    """
+    ([str], str, int, str, int, str, bool, bool, int, bool, str, [str], float, str) -> {str: int}
+
+    Try to solve a database of puzzles under each of a list of
+    variants, named by their constraint modules joined with '+' (see
+    sat_encoding.variant_modules), in one pass over the puzzles:
+    each puzzle is read and encoded once and solved under every
+    variant's rules. Return the number of puzzles solvable as each
+    variant.
+
+    Metrics are written to metrics.csv, with the columns of each
+    variant prefixed by its name, and solutions to
+    <variant>-solutions.csv, so the variants x and stripe give the
+    same files as main. The other options are those of main.
+    """
+
+    if satsolver == 'lazy':
+        raise ValueError('the lazy backend only solves sudoku stripe')
+    check_options(satsolver, preprocess, portfolio = portfolio, timeout = timeout)
+    if len(set(variants)) < len(variants):
+        raise ValueError('variants must be distinct')
+    modules = [variant_modules(variant) for variant in variants]
+    race = portfolio is not None or timeout is not None
+
+    n_puzzles = count_puzzles(filename)
+    print('Found ' + str(n_puzzles) + ' puzzles in ' + filename + '.')
+    variant_rules = load_variants(variants, rule_cache, amo)
+
+    # results are cached per rule set and encoder version
+    rules_keys = [rule_set_name(variant) + '-' + encoder_fingerprint() + ('' if amo == 'pairwise' else '-' + amo)
+                  for variant in modules]
+
+    # solutions are written before metrics, so a puzzle with
+    # metrics on disk has its solutions on disk as well
+    solution_files = [variant + '-solutions.csv' for variant in variants]
+    solution_outputs = [open(path, mode = 'w') for path in solution_files]
+    metrics_output = open('metrics.csv', mode = 'w')
+    outputs = tuple(solution_outputs) + (metrics_output,)
+    metrics_csv = csv.writer(metrics_output)
+    header = [variant + '_' + column for variant in variants
+              for column in ('satisfiable', 'max_level', 'num_decisions', 'conflicts')]
+    if race:
+        header += [variant + '_' + column for variant in variants for column in ('timeout', 'solver')]
+    metrics_csv.writerow(header)
+
+    # scratch cnf files go in a directory of this run's own, removed at the end
+    worker_dir = None
+    if workers > 1 or scratch_dir is not None:
+        worker_dir = tempfile.mkdtemp(prefix='xstripe-', dir=scratch_dir)
+    if workers > 1:
+        pool = multiprocessing.Pool(workers, init_variant_worker, (variant_rules, satsolver, worker_dir, pipe,
+                                                               preprocess, result_cache, rules_keys, portfolio,
+                                                               timeout))
+    else:
+        init_variant_worker(variant_rules, satsolver, worker_dir, pipe, preprocess, result_cache, rules_keys,
+                            portfolio, timeout)
 
     print('Solving puzzles...')
-    for i in range(len(puzzle_cnfs)):
-        x_metrics, x_solution = solve_as(puzzle_cnfs[i], x_rules, satsolver)
-
-        if x_metrics[0]:
-            count_valid_x += 1
-            x_solutions.append((i, compress(puzzles[i]), compress(decode(x_solution))))
-
-        stripe_metrics, stripe_solution = solve_as(puzzle_cnfs[i], stripe_rules, satsolver)
-
-        if stripe_metrics[0]:
-            count_valid_stripe += 1
-            stripe_solutions.append((i, compress(puzzles[i]), compress(decode(stripe_solution))))
-            if x_metrics[0]:
-                count_valid_both += 1
-
-        x_comparison_metrics.append(x_metrics)
-        stripe_comparison_metrics.append(stripe_metrics)
-
-        # print a progress update for every 10% completed
-        if len(puzzle_cnfs) > 10 and (i + 1) % (len(puzzle_cnfs) // 10) == 0:
-            print(str((i + 1) // (len(puzzle_cnfs) // 10)) + '0%...')
-            print(str(count_valid_x) + ' puzzles solvable as x-sudoku')
-            print(str(count_valid_stripe) + ' puzzles solvable as sudoku stripe')
-            print(str(count_valid_both) + ' puzzles solvable both ways')
+    print('Writing results to metrics.csv and ' + ', '.join(solution_files) + '...')
+    counts = np.zeros(len(variants), np.int64)
+    next_index = 0
+    for puzzles in iter_puzzles(filename, batch_size):
+        if workers > 1:
+            # imap hands results back in puzzle order
+            results = pool.imap(solve_variants, puzzles, chunksize=16)
+        else:
+            results = map(solve_variants, puzzles)
+
+        results = iter(results)
+        for start in range(0, len(puzzles), WRITE_EVERY):
+            group = list(itertools.islice(results, WRITE_EVERY))
+            group_puzzles = puzzles[start:start + len(group)]
+            indices = np.arange(next_index, next_index + len(group))
+            # [puzzle][variant]
+            sat = np.array([[bool(metrics[0]) for metrics, _ in result] for result in group], bool)
+
+            # decode and write the group's solutions at once
+            for k, output in enumerate(solution_outputs):
+                write_solutions(output, indices[sat[:, k]].tolist(), group_puzzles[sat[:, k]],
+                                decode_all([result[k][1] for result, solved in zip(group, sat[:, k]) if solved]))
+                output.flush()
+            metrics_csv.writerows([sum((tuple(metrics[:4]) for metrics, _ in result), ())
+                                   + sum((tuple(metrics[4:]) for metrics, _ in result), ()) for result in group])
+            metrics_output.flush()
+
+            # running counts after each puzzle of the group
+            valid = counts + np.cumsum(sat, axis=0)
+            counts = valid[-1]
+
+            if ((indices + 1) % checkpoint_every == 0).any():
+                checkpoint(outputs)
+
+            for k, index in enumerate(indices.tolist()):
+                # print a progress update for every 10% completed
+                if n_puzzles > 10 and (index + 1) % (n_puzzles // 10) == 0:
+                    print(str((index + 1) // (n_puzzles // 10)) + '0%...')
+                    for variant, count in zip(variants, valid[k]):
+                        print(str(count) + ' puzzles solvable as ' + variant)
+            next_index += len(group)
     print('Solved.')
 
-    print('Writing metrics to metrics.csv...')
-    with open('metrics.csv', mode = 'w') as output:
-        csv_output = csv.writer(output)
-        csv_output.writerow(('x_satisfiable', 'x_max_level', 'x_num_decisions', 'x_conflicts', 'stripe_satisfiable', 'stripe_max_level', 'stripe_num_decisions', 'stripe_conflicts'))
-        for row in zip(x_comparison_metrics, stripe_comparison_metrics):
-            csv_output.writerow((row[0][0], row[0][1], row[0][2], row[0][3], row[1][0], row[1][1], row[1][2], row[1][3]))
+    checkpoint(outputs)
+    for output in outputs:
+        output.close()
     print('Written.')
 
-    print('Writing solutions to x-solutions.csv...')
-    with open('x-solutions.csv', mode = 'w') as solutions:
-        csv_output = csv.writer(solutions)
-        for pair in x_solutions:
-            csv_output.writerow(pair)
-    print('Written')
+    if workers > 1:
+        pool.close()
+        pool.join()
+    if worker_dir is not None:
+        shutil.rmtree(worker_dir)
+    return dict(zip(variants, counts.tolist()))
+
+def main(satsolver = 'zchaff', workers = 1, filename = 'sudoku17.txt', batch_size = 10000,
+         scratch_dir = None, pipe = False, rule_cache = True, resume = False, checkpoint_every = 1000,
+         preprocess = False, result_cache = None, canonical = False, portfolio = None, timeout = None,
+         timings = None, shard = None, amo = 'pairwise', schedule = None, stripe_prefilter = False):
+    """
+    (str, int, str, int, str, bool, bool, bool, int, bool, str, bool, [str], float, str, (int, int), str, str,
+     bool) -> None
+
+    Try to solve a database of puzzles as both x-sudoku
+    and sudoku stripes. Print a file of solution metrics.
+
+    With more than one worker, puzzles are solved by a pool of
+    processes, each with its own scratch cnf and solver subprocess.
+    Results are still collected in puzzle order.
+
+    Puzzles are read from filename batch_size at a time.
+
+    Scratch cnf files go in scratch_dir (e.g. /dev/shm) if given;
+    with pipe, solvers that can read each cnf from their stdin do so
+    instead.
+
+    Rule encodings are loaded from the on-disk cache unless
+    rule_cache is False.
+
+    Results are appended to the output files every WRITE_EVERY
+    puzzles and synced to disk every checkpoint_every puzzles. With
+    resume, an interrupted run picks up after the last puzzle it
+    finished.
+
+    With preprocess, each puzzle's givens are propagated through the
+    rules before it is sent to the solver.
+
+    With result_cache, the path of a ResultCache file, puzzles solved
+    before with the same rules and solver are looked up instead of
+    solved. With canonical, x-sudoku puzzles are solved (and cached)
+    in the canonical form of their symmetry class.
+
+    With a portfolio, a list of external solvers, every puzzle is
+    solved by all of them at once and the first verdict is kept.
+    With a timeout, each puzzle gets that many seconds per rule set.
+    Either adds columns to metrics.csv recording timeouts and the
+    solver that answered.
+
+    With timings, the path of a sidecar csv file, the time each
+    puzzle spends in each stage of solving is written there, and a
+    histogram of each stage and the throughput are printed with
+    each progress update.
+
+    With shard (k, n), only the k-th of n contiguous ranges of the
+    puzzles is solved and the output files are tagged with the shard
+    (see shard_path), to be combined by merge_shards.
+
+    amo is the at-most-one encoding of the rules, one of
+    AMO_ENCODINGS in sat_encoding.py.
+
+    With schedule and more than one worker, the puzzles of each batch
+    are handed out one at a time, the most expensive first, so that
+    no slow puzzle is left to run alone at the end of a batch. Costs
+    are estimated from the givens or, if schedule is the path of an
+    earlier run's metrics.csv or timings file, taken from there (see
+    schedule.py); a shard's metrics file is matched to its puzzles by
+    its name. Results are still written in puzzle order.
+
+    With stripe_prefilter, the stripes each puzzle's givens allow are
+    found for a whole batch at once (stripe_candidates); puzzles that
+    allow none are unsatisfiable as sudoku stripe without calling a
+    solver, and for the others only the allowed stripes are encoded.
+    """
+
+    check_options(satsolver, preprocess, stripe_prefilter, portfolio, timeout)
+    check_schedule(schedule, shard, timings)
+    race = portfolio is not None or timeout is not None
+
+    n_puzzles = count_puzzles(filename)
+    print('Found ' + str(n_puzzles) + ' puzzles in ' + filename + '.')
+    first, last = 0, n_puzzles
+    if shard is not None:
+        first, last = shard_range(n_puzzles, shard)
+        print('Solving shard ' + str(shard[0]) + ' of ' + str(shard[1]) + ': puzzles '
+              + str(first) + ' to ' + str(last - 1) + '.')
+        n_puzzles = last - first
+    metrics_file = shard_path('metrics.csv', shard)
+    x_file = shard_path('x-solutions.csv', shard)
+    stripe_file = shard_path('stripe-solutions.csv', shard)
+
+    x_rules, stripe_rules = load_rules(rule_cache, amo, stripe_prefilter)
+
+    # results are cached per rule set and encoder version
+    rules_keys = ('9x9x9-x-' + encoder_fingerprint(), '9x9x9-stripe-' + encoder_fingerprint())
+    if amo != 'pairwise':
+        # the lazy backend holds its own pairwise sudoku rules, whatever amo
+        rules_keys = (rules_keys[0] + '-' + amo,
+                      rules_keys[1] + ('' if satsolver == 'lazy' else '-' + amo))
+    if stripe_prefilter:
+        rules_keys = (rules_keys[0], rules_keys[1] + '-prefilter')
+
+    # costs are read before any output is opened
+    known_costs = None
+    if schedule:
+        # the rows of a shard's metrics file start at the shard's first puzzle
+        schedule_shard = shard_of(schedule)
+        offset = 0 if schedule_shard is None else shard_range(count_puzzles(filename), schedule_shard)[0]
+        known_costs = load_costs(schedule, offset)
+
+    if resume and os.path.exists(metrics_file):
+        done, count_valid_x, count_valid_stripe, count_valid_both = resume_outputs(metrics_file, x_file, stripe_file,
+                                                                                   first)
+        print('Resuming after ' + str(done) + ' puzzles.')
+        mode = 'a'
+    else:
+        done, count_valid_x, count_valid_stripe, count_valid_both = 0, 0, 0, 0
+        mode = 'w'
+
+    # solutions are written before metrics, so a puzzle with
+    # metrics on disk has its solutions on disk as well
+    x_output = open(x_file, mode = mode)
+    stripe_output = open(stripe_file, mode = mode)
+    metrics_output = open(metrics_file, mode = mode)
+    outputs = (x_output, stripe_output, metrics_output)
+    metrics_csv = csv.writer(metrics_output)
+    if metrics_output.tell() == 0:
+        metrics_csv.writerow(METRICS_HEADER + (RACE_HEADER if race else ()))
+
+    report = None
+    if timings is not None:
+        timings = shard_path(timings, shard)
+        if mode == 'a':
+            # drop the timings of puzzles that will be solved again
+            lines = complete_lines(timings)
+            rewrite_lines(timings, lines[:1] + [line for line, row in zip(lines[1:], csv.reader(lines[1:]))
+                                                if int(row[0]) < first + done])
+        report = TimingReport(timings, mode)
+
+    # scratch cnf files go in a directory of this run's own, removed at the end
+    worker_dir = None
+    if workers > 1 or scratch_dir is not None:
+        worker_dir = tempfile.mkdtemp(prefix='xstripe-', dir=scratch_dir)
+    if workers > 1:
+        pool = multiprocessing.Pool(workers, init_worker, (x_rules, stripe_rules, satsolver, worker_dir, pipe, preprocess,
+                                                       result_cache, canonical, rules_keys, portfolio, timeout,
+                                                       report is not None, stripe_prefilter))
+    else:
+        init_worker(x_rules, stripe_rules, satsolver, worker_dir, pipe, preprocess,
+                    result_cache, canonical, rules_keys, portfolio, timeout, report is not None, stripe_prefilter)
+
+    print('Solving puzzles...')
+    print('Writing results to ' + metrics_file + ', ' + x_file + ' and ' + stripe_file + '...')
+    # skip puzzles finished by an earlier run or outside the shard
+    next_index = first + done
+    for puzzles in iter_puzzles(filename, batch_size, start = first + done, stop = last):
+        candidates = stripe_candidates(puzzles) if stripe_prefilter else None
+        if workers > 1 and schedule is not None:
+            results = hardest_first_results(pool, puzzles, hardest_first(puzzles, next_index, known_costs), candidates)
+        elif workers > 1 and stripe_prefilter:
+            results = pool.imap(solve_item, zip(puzzles, candidates), chunksize=16)
+        elif workers > 1:
+            # imap hands results back in puzzle order
+            results = pool.imap(solve_puzzle, puzzles, chunksize=16)
+        elif stripe_prefilter:
+            results = map(solve_puzzle, puzzles, candidates)
+        else:
+            results = map(solve_puzzle, puzzles)
+
+        results = iter(results)
+        for start in range(0, len(puzzles), WRITE_EVERY):
+            group = list(itertools.islice(results, WRITE_EVERY))
+            group_puzzles = puzzles[start:start + len(group)]
+            indices = np.arange(next_index, next_index + len(group))
+            x_sat = np.array([bool(result[0][0]) for result in group], bool)
+            stripe_sat = np.array([bool(result[2][0]) for result in group], bool)
+
+            # decode and write the group's solutions at once
+            decode_start = time.perf_counter()
+            write_solutions(x_output, indices[x_sat].tolist(), group_puzzles[x_sat],
+                            decode_all([result[1] for result, sat in zip(group, x_sat) if sat]))
+            x_decode = time.perf_counter() - decode_start
+            write_solutions(stripe_output, indices[stripe_sat].tolist(), group_puzzles[stripe_sat],
+                            decode_all([result[3] for result, sat in zip(group, stripe_sat) if sat]))
+            stripe_decode = time.perf_counter() - decode_start - x_decode
+            x_output.flush()
+            stripe_output.flush()
+            metrics_csv.writerows([x_metrics[:4] + stripe_metrics[:4] + x_metrics[4:] + stripe_metrics[4:]
+                                   for x_metrics, _, stripe_metrics, _, _ in group])
+            metrics_output.flush()
+
+            if report is not None:
+                # the group's decoding time is shared by its puzzles
+                for _, _, _, _, (x_timings, stripe_timings) in group:
+                    x_timings['decode'] = x_decode / len(group)
+                    stripe_timings['decode'] = stripe_decode / len(group)
+                report.add(indices.tolist(), [result[4] for result in group])
+
+            # running counts after each puzzle of the group
+            valid_x = count_valid_x + np.cumsum(x_sat)
+            valid_stripe = count_valid_stripe + np.cumsum(stripe_sat)
+            valid_both = count_valid_both + np.cumsum(x_sat & stripe_sat)
+            count_valid_x, count_valid_stripe, count_valid_both = int(valid_x[-1]), int(valid_stripe[-1]), int(valid_both[-1])
+
+            if ((indices - first + 1) % checkpoint_every == 0).any():
+                checkpoint(outputs)
+
+            for k, index in enumerate(indices.tolist()):
+                # print a progress update for every 10% completed
+                if n_puzzles > 10 and (index - first + 1) % (n_puzzles // 10) == 0:
+                    print(str((index - first + 1) // (n_puzzles // 10)) + '0%...')
+                    print(str(valid_x[k]) + ' puzzles solvable as x-sudoku')
+                    print(str(valid_stripe[k]) + ' puzzles solvable as sudoku stripe')
+                    print(str(valid_both[k]) + ' puzzles solvable both ways')
+                    if report is not None:
+                        print(report.summary())
+            next_index += len(group)
+    print('Solved.')
+    if report is not None:
+        print(report.summary())
+        report.close()
+        print('Timings written to ' + timings + '.')
+
+    checkpoint(outputs)
+    for output in outputs:
+        output.close()
+    print('Written.')
 
-    print('Writing solutions to stripe-solutions.csv...')
-    with open('stripe-solutions.csv', mode = 'w') as solutions:
-        csv_output = csv.writer(solutions)
-        for pair in stripe_solutions:
-            csv_output.writerow(pair)
-    print('Written')
+    if workers > 1:
+        pool.close()
+        pool.join()
+    if worker_dir is not None:
+        shutil.rmtree(worker_dir)
 
 
 if __name__ == '__main__':
-    if(len(sys.argv) > 1):
-        main(sys.argv[1])
+    parser = argparse.ArgumentParser(description='Compare x-sudoku and sudoku stripe with a SAT solver.')
+    parser.add_argument('satsolver', nargs='?', default='zchaff', help='zchaff (default), cadical, minisat, glucose, kissat, cdcl, pycosat, incremental or lazy')
+    parser.add_argument('-j', '--workers', type=int, default=1,
+                        help='number of solver processes to run in parallel (0 for one per core)')
+    parser.add_argument('--puzzles', default='sudoku17.txt',
+                        help='file of puzzles, one per line (default sudoku17.txt)')
+    parser.add_argument('--batch-size', type=int, default=10000,
+                        help='number of puzzles to read from the file at a time')
+    parser.add_argument('--scratch-dir',
+                        help='directory for scratch cnf files, e.g. a tmpfs such as /dev/shm')
+    parser.add_argument('--pipe', action='store_true',
+                        help='stream each cnf to the solver\'s stdin instead of a file (cadical and kissat)')
+    parser.add_argument('--no-rule-cache', dest='rule_cache', action='store_false',
+                        help='encode the rules afresh instead of loading them from ' + ENCODING_CACHE)
+    parser.add_argument('--resume', action='store_true',
+                        help='continue an interrupted run from its output files')
+    parser.add_argument('--checkpoint', type=int, default=1000,
+                        help='sync the output files to disk every this many puzzles')
+    parser.add_argument('--preprocess', action='store_true',
+                        help='propagate the givens through the rules before solving')
+    parser.add_argument('--result-cache', metavar='FILE',
+                        help='look up and store results in this SQLite file, e.g. results.sqlite')
+    parser.add_argument('--canonical', action='store_true',
+                        help='solve x-sudoku puzzles in the canonical form of their symmetry class')
+    parser.add_argument('--portfolio', nargs='+', metavar='SOLVER',
+                        help='race these external solvers on every puzzle and keep the first verdict')
+    parser.add_argument('--timeout', type=float, metavar='SECONDS',
+                        help='give up on a puzzle after this many seconds and record a timeout')
+    parser.add_argument('--timings', nargs='?', const='timings.csv', metavar='FILE',
+                        help='record the time each puzzle spends in each stage (default file timings.csv)')
+    parser.add_argument('--shard', type=parse_shard, metavar='K/N',
+                        help='solve only the K-th of N equal ranges of the puzzles, into files tagged with the shard')
+    parser.add_argument('--amo', choices=AMO_ENCODINGS, default='pairwise',
+                        help='at-most-one encoding of the rules (default pairwise)')
+    parser.add_argument('--hardest-first', nargs='?', const='', metavar='FILE',
+                        help='with several workers, solve the most expensive puzzles of each batch first, by '
+                             'estimate or by the costs in an earlier metrics.csv or timings file')
+    parser.add_argument('--stripe-prefilter', action='store_true',
+                        help='encode only the stripes each puzzle\'s givens allow, and skip the solver if there are none')
+    parser.add_argument('--variants', nargs='+', metavar='VARIANT',
+                        help='solve every puzzle under each of these variants in one pass, each named by its '
+                             'constraints joined with + (' + ', '.join(name for name in CONSTRAINTS if name != 'sudoku')
+                             + '), e.g. x windoku anti-knight+non-consecutive')
+    parser.add_argument('--merge', action='store_true',
+                        help='combine the finished shard outputs in this directory into the usual output files')
+    parser.add_argument('--classify', nargs='?', type=int, const=2, metavar='K',
+                        help='count each puzzle\'s solutions up to K (default 2) with pycosat and write them, '
+                             'with its class, to classes.csv')
+    args = parser.parse_args()
+    if not args.merge and args.classify is None:
+        # fail before any output file is opened
+        try:
+            check_options(args.satsolver, args.preprocess, args.stripe_prefilter, args.portfolio, args.timeout)
+            if args.variants is None:
+                check_schedule(args.hardest_first, args.shard, args.timings)
+        except ValueError as error:
+            parser.error(str(error))
+    if args.merge:
+        try:
+            n_puzzles, count_valid_x, count_valid_stripe, count_valid_both = merge_shards(args.puzzles)
+        except ValueError as error:
+            sys.exit('Cannot merge: ' + str(error))
+        print('Merged the results of ' + str(n_puzzles) + ' puzzles into metrics.csv, x-solutions.csv and stripe-solutions.csv.')
+        print(str(count_valid_x) + ' puzzles solvable as x-sudoku')
+        print(str(count_valid_stripe) + ' puzzles solvable as sudoku stripe')
+        print(str(count_valid_both) + ' puzzles solvable both ways')
+    elif args.classify is not None:
+        try:
+            totals = classify(args.puzzles, args.workers or os.cpu_count(), args.batch_size, args.classify,
+                              args.rule_cache, args.amo)
+        except ValueError as error:
+            sys.exit('Cannot classify: ' + str(error))
+        for rules, name in (('x', 'x-sudoku'), ('stripe', 'sudoku stripe')):
+            print('As ' + name + ': ' + ', '.join(str(count) + ' ' + solution_class for solution_class, count
+                                                 in totals[rules].items()))
+    elif args.variants is not None:
+        unsupported = [option for option, value in (('--resume', args.resume), ('--canonical', args.canonical),
+                                                    ('--timings', args.timings), ('--shard', args.shard),
+                                                    # a bare --hardest-first stores ''
+                                                    ('--hardest-first', args.hardest_first is not None),
+                                                    ('--stripe-prefilter', args.stripe_prefilter)) if value]
+        if unsupported:
+            sys.exit('Cannot compare variants with ' + ', '.join(unsupported))
+        try:
+            compare_variants(args.variants, args.satsolver, args.workers or os.cpu_count(), args.puzzles,
+                             args.batch_size, args.scratch_dir, args.pipe, args.rule_cache, args.checkpoint,
+                             args.preprocess, args.result_cache, args.portfolio, args.timeout, args.amo)
+        except ValueError as error:
+            sys.exit('Cannot compare variants: ' + str(error))
     else:
-        main()
+        main(args.satsolver, args.workers or os.cpu_count(), args.puzzles, args.batch_size,
+             args.scratch_dir, args.pipe, args.rule_cache, args.resume, args.checkpoint,
+             args.preprocess, args.result_cache, args.canonical, args.portfolio, args.timeout,
+             args.timings, args.shard, args.amo, args.hardest_first, args.stripe_prefilter)